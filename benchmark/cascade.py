@@ -0,0 +1,39 @@
+"""
+层叠顺序 声明块相同的规则共用一个解析结果 但仍按各自在样式表中的位置叠加
+
+在 ./benchmark 目录下运行 `python cascade.py`
+"""
+
+import sys
+
+sys.path.append("..")
+from vue2img import Template, createApp
+
+vue = """
+<template>
+  <div class="page">
+    <div class="row a b c"></div>
+    <div class="row a c"></div>
+  </div>
+</template>
+<style>
+.page { width: 100px; height: 200px; }
+.row { height: 100px; }
+.a{background-color:red}
+.c{background-color:blue}
+.b{background-color:red}
+</style>
+"""
+
+
+class Page(Template): ...
+
+
+if __name__ == "__main__":
+    app = createApp(Page(vue)).mount().export()
+    # `.b` 与 `.a` 的声明块相同 写在 `.c` 后面 应当覆盖 `.c`
+    print("a b c:", app.canvas.getpixel((50, 50)))
+    assert app.canvas.getpixel((50, 50)) == (255, 0, 0, 255)
+    print("a c:", app.canvas.getpixel((50, 150)))
+    assert app.canvas.getpixel((50, 150)) == (0, 0, 255, 255)
+    print("ok")
@@ -0,0 +1,114 @@
+"""
+对比直接拆分字符串与 `vue2img.css` 生成规则、声明对象的开销 并检查旧实现会切错的写法
+
+`vue2img.css` 跳过字符串、括号里的分号和大括号以及 @ 规则的块 结果去掉了首尾空白 旧实现只按字符切分
+
+在 ./benchmark 目录下运行 `python css_parser.py`
+"""
+
+import re
+import sys
+import time
+
+sys.path.append("..")
+from vue2img import Style, makeAttribute
+from vue2img.css import parse_declarations, parse_rules
+
+# 旧实现 原样保留在这里作为对照
+stylePattern = re.compile(r"[^:|\n|;]+:[^;]+")
+
+
+def legacy(text: str):
+    rules = []
+    for item in re.sub(r"/\*.*?\*/", "", text).split("}"):
+        item_split = item.split("{")
+        if len(item_split) != 2 or item_split[1].strip() == "":
+            continue
+        style = Style()
+        for cmd in stylePattern.findall(item_split[1].strip()):
+            attr = makeAttribute(cmd)
+            style[attr.name] = attr
+        rules.append((item_split[0].strip(), style))
+    return rules
+
+
+def module(text: str):
+    return [(rule.selectors, Style.from_declarations(rule.declarations)) for rule in parse_rules(text)]
+
+
+def legacy_split(text: str):
+    "只拆分字符串 不生成属性"
+
+    rules = []
+    for item in re.sub(r"/\*.*?\*/", "", text).split("}"):
+        item_split = item.split("{")
+        if len(item_split) != 2 or item_split[1].strip() == "":
+            continue
+        rules.append((item_split[0].strip(), [cmd.split(":") for cmd in stylePattern.findall(item_split[1].strip())]))
+    return rules
+
+
+def stylesheet(declarations: int = 5000) -> str:
+    values = [
+        "color: #1D1D1F;",
+        "margin: 0 0 24px;",
+        "padding: 1.5em 1.5em 17px;",
+        "font-size: 32px;",
+        "border-radius: 1em;",
+        "width: calc(100% - 2em);",
+        "background-color: white;",
+        "display: inline;",
+    ]
+    lines = []
+    for i in range(declarations // 5):
+        body = "\n  ".join(values[(i + j) % len(values)] for j in range(5))
+        lines.append(f".rule{i} span, #id{i} {{\n  /* rule {i} */\n  {body}\n}}\n")
+    return "\n".join(lines)
+
+
+# 样式表与期望的 (选择器, [(属性名, 值), ...])
+cases = [
+    ('.a { content: "a;b}c"; color: red } .b { color: blue }', [(".a", [("content", '"a;b}c"'), ("color", "red")]), (".b", [("color", "blue")])]),
+    (".a { font-family: 'x{y'; color: red }", [(".a", [("font-family", "'x{y'"), ("color", "red")])]),
+    (".a { background-image: url(data:image/png;base64,AAAA); color: red }", [(".a", [("background-image", "url(data:image/png;base64,AAAA)"), ("color", "red")])]),
+    ("@media screen { .a { color: red } .b { color: red } } .c { color: blue }", [(".c", [("color", "blue")])]),
+    ('@import url("x.css"); @font-face { src: url(a;b) } .c { color: blue }', [(".c", [("color", "blue")])]),
+    (".a { color: red; &:hover { color: blue } margin: 0 }", [(".a", [("color", "red"), ("margin", "0")])]),
+    ('/* x */ .a { /* y */ color: red } .b { content: "/* z */" }', [(".a", [("color", "red")]), (".b", [("content", '"/* z */"')])]),
+    (".a { color: red; width: ; : 1px; height\n: 2px }", [(".a", [("color", "red"), ("height", "2px")])]),
+    (".a { color: red } } .b { color: blue", [(".a", [("color", "red")]), (".b", [("color", "blue")])]),
+]
+
+
+def check():
+    for text, expected in cases:
+        result = [(rule.selectors, [tuple(d) for d in rule.declarations]) for rule in parse_rules(text)]
+        assert result == expected, (text, result)
+    inline = 'width: 10px; content: "a;b"; background: url(x;y)'
+    assert parse_declarations(inline) == [("width", "10px"), ("content", '"a;b"'), ("background", "url(x;y)")]
+
+
+def bench(func, text: str, number: int = 5) -> float:
+    best = float("inf")
+    for _ in range(number):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    check()
+    print(f"cases: {len(cases) + 1} ok")
+
+    text = stylesheet(5000)
+    assert len(legacy(text)) == len(module(text))
+
+    split_old = bench(legacy_split, text)
+    split_new = bench(parse_rules, text)
+    full_old = bench(legacy, text)
+    full_new = bench(module, text)
+
+    print(f"{'':<24}{'inline':>12}{'css module':>12}{'ratio':>10}")
+    print(f"{'split declarations':<24}{split_old * 1000:>10.2f}ms{split_new * 1000:>10.2f}ms{split_old / split_new:>9.2f}x")
+    print(f"{'build Style rules':<24}{full_old * 1000:>10.2f}ms{full_new * 1000:>10.2f}ms{full_old / full_new:>9.2f}x")
@@ -0,0 +1,42 @@
+"""
+深层嵌套模板的排版耗时
+
+在 ./benchmark 目录下运行 `python deep.py [层数] [vue2img 所在目录]`
+
+libxml2 最多解析约 2000 层嵌套 更深的树直接用 `VNode` 构造 `Compiled` 再渲染
+"""
+
+import sys
+import time
+
+sys.path.insert(0, sys.argv[2] if len(sys.argv) > 2 else "..")
+from lxml.etree import Element
+
+from vue2img import Compiled, Template, VNode
+from vue2img.compiler import parse_block
+
+
+def compiled(depth: int) -> Compiled:
+    "每层 1px padding 的单链"
+
+    style = parse_block("padding: 1px;")
+    node = VNode(tag="div", inner_style=style)
+    for _ in range(depth - 1):
+        node = VNode(tag="div", inner_style=style, children=(node,))
+    root = VNode(tag="template", inner_style=parse_block("width: 100000px;font-size: 16px;"), children=(node,))
+    return Compiled(root=root, script="", style="", template=Element("template"), elements=dict())
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    limit = sys.getrecursionlimit()
+
+    start = time.perf_counter()
+    App = Template(compiled=compiled(depth))
+    elapsed = time.perf_counter() - start
+
+    dom, level = App.root, 0
+    while dom.childNodes:
+        dom, level = dom.childNodes[0], level + 1
+    print(f"depth: {level}  recursion limit: {limit}  time: {elapsed:.2f}s")
+    print(f"deepest: x={dom.content.x} y={dom.content.y} width={dom.content.width}")
@@ -0,0 +1,58 @@
+"""
+显示列表 各个优化步骤剩下的指令数、剔除统计、重放到多张画布、序列化以及比较两次渲染
+
+在 ./benchmark 目录下运行 `python display.py 字体路径 [卡片数]`
+"""
+
+import json
+import sys
+import time
+
+sys.path.append("..")
+from PIL import ImageChops, ImageDraw
+
+from raster import Page, direct, template
+from vue2img import DisplayList, PaintStats, createApp, image, memoize
+
+
+def timeit(name: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{name + ':':<16}{(time.perf_counter() - start) * 1000:.1f}ms")
+    return result
+
+
+if __name__ == "__main__":
+    font = sys.argv[1]
+    cards = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    App = Page(template(cards, font))
+    expected = timeit("direct paint", lambda: direct(App))
+
+    draw = ImageDraw.Draw(image(1, 1))
+    compiled = timeit("compile", lambda: DisplayList.compile(App.root, draw))
+    stats = PaintStats()
+    culled = timeit("cull", lambda: compiled.cull(expected.size, stats))
+    memoized = timeit("memoize", lambda: memoize(App.root, culled))
+    merged = timeit("merge text", memoized.merge_text)
+    print(f"ops: compiled {len(compiled)}  culled {len(culled)}  memoized {len(memoized)}  merged {len(merged)}")
+    print(f"skipped: {stats}")
+
+    canvases = [image(*expected.size) for _ in range(3)]
+    for i, canvas in enumerate(canvases):
+        timeit(f"replay #{i}", lambda: merged.replay(canvas))
+    print("same:", all(ImageChops.difference(canvas, expected).getbbox() is None for canvas in canvases))
+
+    data, images = timeit("dump", merged.dump)
+    text = json.dumps(data)
+    print(f"json: {len(text) / 1024:.1f}KiB  images: {len(images)}")
+    print("load equal:", DisplayList.load(json.loads(text), images) == merged)
+
+    app = createApp(App).mount().export()
+    print(f"export: {app.stats}")
+    before = app.display
+    App.update(fans=1000001)
+    after = app.compile()
+    boxes = timeit("diff", lambda: before.diff(after))
+    print(f"changed ops: {len(boxes)}")
+    app.update(fans=1000002)
+    print(f"update: {app.stats}")
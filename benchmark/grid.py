@@ -0,0 +1,42 @@
+"""
+数百个统计卡片组成的网格面板
+
+在 ./benchmark 目录下运行 `python grid.py [卡片数] [vue2img 所在目录]`
+"""
+
+import sys
+import time
+
+sys.path.insert(0, sys.argv[2] if len(sys.argv) > 2 else "..")
+from vue2img import Template
+
+
+def template(cells: int) -> str:
+    "卡片高度不同 不含文字 避免依赖字体"
+
+    items = "".join(f'<div class="cell" style="height: {20 + i % 3 * 10}px"></div>' for i in range(cells))
+    return f"""
+<template>
+  <div class="panel">{items}</div>
+</template>
+<style>
+.panel {{ display: grid; grid-template-columns: 1fr 2fr 1fr 100px; grid-gap: 8px; padding: 16px; }}
+.cell {{ margin: 2px; background-color: #F6F6F6; }}
+</style>
+"""
+
+
+if __name__ == "__main__":
+    cells = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    vue = template(cells)
+    Template.compile(vue)  # 只统计排版
+
+    start = time.perf_counter()
+    App = Template(vue)
+    elapsed = time.perf_counter() - start
+
+    panel = App.root.childNodes[0]
+    print(f"cells: {len(panel.childNodes)}  time: {elapsed:.3f}s  panel height: {panel.content.height}")
+    for dom in panel.childNodes[:6]:
+        c = dom.content
+        print(f"  x={c.x:.1f} y={c.y:.1f} width={c.width:.1f} height={c.finalHeight:.1f}")
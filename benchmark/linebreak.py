@@ -0,0 +1,58 @@
+"""
+对比旧的逐字测量断行、`vue2img.text.break_lines` 与使用字形缓存的 `FontMetrics.break_lines`
+
+在 ./benchmark 目录下运行 `python linebreak.py 字体路径 [字数]`
+"""
+
+import random
+import sys
+import time
+
+sys.path.append("..")
+from PIL import ImageFont
+
+from vue2img.manager import FontMetrics
+from vue2img.text import break_lines
+
+
+# 旧实现 原样保留在这里作为对照
+def legacy(text: str, font: ImageFont.FreeTypeFont, max_width: float):
+    def split(text: str, max_width: float):
+        temp = ""
+        for chn in text:
+            if font.getlength(temp + chn) > max_width:
+                return temp
+            temp += chn
+        return temp
+
+    sentences = []
+    tt = text
+    while len(tt):
+        temp = split(tt, max_width)
+        sentences.append(temp)
+        tt = tt.replace(temp, "", 1)
+    return sentences
+
+
+if __name__ == "__main__":
+    font = ImageFont.truetype(sys.argv[1], 16, encoding="utf-8")
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    random.seed(0)
+    text = "".join(random.choice("弹幕文字测试 danmaku text, 123!") for _ in range(length))
+
+    start = time.perf_counter()
+    old = legacy(text, font, 800)
+    print(f"{'legacy:':<14}{time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    new = [text[s:e] for s, e in break_lines(text, font.getlength, 800)]
+    print(f"{'break_lines:':<14}{time.perf_counter() - start:.3f}s")
+
+    metrics = FontMetrics(font)
+    for name in ("metrics cold", "metrics warm"):
+        start = time.perf_counter()
+        cached = [text[s:e] for s, e in metrics.break_lines(text, 800)]
+        print(f"{name + ':':<14}{time.perf_counter() - start:.3f}s")
+
+    print(f"lines: {len(new)}  same: {old == new == cached}")
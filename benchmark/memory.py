@@ -0,0 +1,88 @@
+"""
+用 tracemalloc 统计 10k 节点模板每个节点占用的内存 以及单纯建立文字节点的开销
+
+在 ./benchmark 目录下运行 `python memory.py [节点数] [vue2img 所在目录]`
+
+第二个参数可以指向另一份代码 方便对比优化前后
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, sys.argv[2] if len(sys.argv) > 2 else "..")
+from vue2img import DivDOM, Template, dfs
+
+
+def template(nodes: int) -> str:
+    "每个卡片 5 个节点 不含文字 避免依赖字体"
+
+    cards = "".join(
+        f'<div class="card"><div class="head"></div><div class="body" style="padding: {i % 3}px">'
+        '<span class="cell"></span><span class="cell"></span></div></div>'
+        for i in range(nodes // 5)
+    )
+    return f"""
+<template>
+  <div class="outer">{cards}</div>
+</template>
+<style>
+.outer {{ padding: 1em; background-color: white; }}
+.card {{ margin: 4px 0; padding: 0 1em; border-radius: 4px; background-color: #F6F6F6; }}
+.head {{ height: 20px; margin: 0 0 4px; }}
+.body {{ display: grid; grid-template-columns: 1fr 1fr; }}
+.cell {{ height: 12px; display: inline; }}
+</style>
+"""
+
+
+def count(root) -> int:
+    total = [0]
+
+    @dfs(root)
+    def _(dom, depth, parent):
+        total[0] += 1
+
+    return total[0]
+
+
+def text_nodes(nodes: int):
+    "只建立文字节点 不排版"
+
+    parent = DivDOM()
+    gc.collect()
+    tracemalloc.start()
+    for i in range(nodes):
+        parent.append(str(i))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"text nodes: {nodes}  retained: {current / nodes:.0f} B/node")
+
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    vue = template(nodes)
+    if hasattr(Template, "compile"):
+        # 编译结果与节点数无关 不计入 优化前的代码没有这一步
+        Template.compile(vue)
+
+    # 先单独计时 tracemalloc 会让分配慢上数倍
+    start = time.perf_counter()
+    Template(vue)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    traced = time.perf_counter()
+    App = Template(vue)
+    traced = time.perf_counter() - traced
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = count(App.root)
+    print(f"nodes: {total}  time: {elapsed:.2f}s  traced: {traced:.2f}s")
+    print(f"retained: {current / total:.0f} B/node  peak: {peak / total:.0f} B/node")
+
+    text_nodes(nodes)
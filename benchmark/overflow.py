@@ -0,0 +1,54 @@
+"""
+overflow: hidden 的裁剪范围 普通子孙和包含块在容器内的 absolute 子孙被裁剪 包含块在容器外的 absolute 子孙不裁剪
+
+在 ./benchmark 目录下运行 `python overflow.py`
+"""
+
+import sys
+
+sys.path.append("..")
+from vue2img import Clip, Template, createApp
+
+vue = """
+<template>
+  <div class="page">
+    <div class="box">
+      <div class="tall"></div>
+      <div class="escape"></div>
+      <div class="frame">
+        <div class="inside"></div>
+      </div>
+    </div>
+  </div>
+</template>
+<style>
+.page { width: 400px; height: 400px; background-color: white; }
+.box { width: 200px; height: 100px; background-color: #DDDDDD; overflow: hidden; }
+.tall { width: 50px; height: 300px; background-color: red; }
+.escape { position: absolute; top: 150px; left: 250px; width: 100px; height: 100px; background-color: green; }
+.frame { position: relative; width: 200px; height: 100px; overflow: hidden; }
+.inside { position: absolute; top: 150px; left: 100px; width: 100px; height: 100px; background-color: blue; }
+</style>
+"""
+
+
+class Page(Template): ...
+
+
+if __name__ == "__main__":
+    App = Page(vue)
+    app = createApp(App).mount().export()
+    ops = {dom.attributes.get("class"): op for op, dom in zip(app.display.ops, app.display.owners)}
+    print(f"ops: {dict((name, type(op).__name__) for name, op in ops.items())}")
+    print(f"stats: {app.stats}")
+
+    # 普通子孙超出容器的部分被裁掉
+    assert isinstance(ops["tall"], Clip)
+    assert app.canvas.getpixel((10, 200)) == (255, 255, 255, 255)
+    # 包含块是根节点 在 .box 外 不裁剪
+    assert not isinstance(ops["escape"], Clip)
+    assert app.canvas.getpixel((300, 200)) == (0, 128, 0, 255)
+    # 包含块 .frame 自己就是裁剪容器 完全在外面的 absolute 子孙被剔除
+    assert "inside" not in ops
+    assert app.canvas.getpixel((150, 200)) == (255, 255, 255, 255)
+    print("ok")
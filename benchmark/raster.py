@@ -0,0 +1,74 @@
+"""
+固定页眉页脚加上大量相同卡片 对比逐个节点绘制与子树位图缓存
+
+在 ./benchmark 目录下运行 `python raster.py 字体路径 [卡片数]`
+"""
+
+import sys
+import time
+
+sys.path.append("..")
+from PIL import ImageChops, ImageDraw
+
+from vue2img import Template, bfs, createApp
+from vue2img.raster import rasterCache, rasterSeen
+
+
+def template(cards: int, font: str) -> str:
+    card = '<div class="card"><p class="name">{{ name }}</p><p>粉丝 {{ fans }}</p><div class="bar"></div></div>'
+    return f"""
+<template>
+  <div class="page">
+    <div class="header"><h1>数据面板</h1><p>每日更新</p></div>
+    {card * cards}
+    <div class="footer"><p>数据来源：bilibili</p></div>
+  </div>
+</template>
+<style>
+.page {{ background-color: #F6F6F6; padding: 16px; font-family: "{font}"; }}
+.header {{ background-color: white; border-radius: 12px; padding: 16px; margin: 0 0 16px; }}
+.card {{ background-color: white; border-radius: 12px; padding: 16px; margin: 0 0 12px; }}
+.name {{ font-size: 24px; }}
+.bar {{ height: 12px; background-color: #4AC2F6; }}
+.footer {{ background-color: white; padding: 8px; }}
+</style>
+"""
+
+
+class Page(Template):
+    def data(self):
+        return {"name": "七海Nana7mi", "fans": 1000000}
+
+
+def direct(App: Template):
+    "逐个节点绘制 作为对照"
+
+    app = createApp(App).mount()
+    draw = ImageDraw.Draw(app.canvas)
+
+    @bfs(App.root)
+    def _(dom, depth, parent):
+        dom.paste(app.canvas, draw)
+
+    return app.canvas
+
+
+if __name__ == "__main__":
+    font = sys.argv[1]
+    cards = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    vue = template(cards, font)
+    App = Page(vue)
+
+    start = time.perf_counter()
+    expected = direct(App)
+    print(f"{'direct:':<10}{(time.perf_counter() - start) * 1000:.1f}ms")
+
+    for name in ("cold", "warm"):
+        if name == "cold":
+            rasterCache.clear()
+            rasterSeen.clear()
+        start = time.perf_counter()
+        canvas = createApp(App).mount().export().canvas
+        print(f"{name + ':':<10}{(time.perf_counter() - start) * 1000:.1f}ms  {rasterCache.info()}")
+
+    print("same:", ImageChops.difference(canvas, expected).getbbox() is None)
@@ -0,0 +1,42 @@
+"""
+2 万个子节点的列表容器 排版时每个子节点都会访问前一个兄弟
+
+在 ./benchmark 目录下运行 `python siblings.py [子节点数] [vue2img 所在目录]`
+"""
+
+import sys
+import time
+
+sys.path.insert(0, sys.argv[2] if len(sys.argv) > 2 else "..")
+from vue2img import Template
+
+
+def template(children: int) -> str:
+    "行内与块级节点交替 不含文字 避免依赖字体"
+
+    items = "".join(
+        '<span class="item"></span>' if i % 2 else '<div class="row"></div>'
+        for i in range(children)
+    )
+    return f"""
+<template>
+  <div class="list">{items}</div>
+</template>
+<style>
+.item {{ width: 10px; height: 10px; }}
+.row {{ height: 4px; }}
+</style>
+"""
+
+
+if __name__ == "__main__":
+    children = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    vue = template(children)
+    Template.compile(vue)  # 只统计排版
+
+    start = time.perf_counter()
+    App = Template(vue)
+    elapsed = time.perf_counter() - start
+
+    container = App.root.childNodes[0]
+    print(f"children: {len(container.childNodes)}  time: {elapsed:.2f}s  height: {container.content.height}")
@@ -0,0 +1,60 @@
+"""
+遍历耗时随节点数的变化 分别测试 1k 10k 100k 节点
+
+在 ./benchmark 目录下运行 `python traversal.py [vue2img 所在目录]`
+
+旧版本没有 `iter_preorder` `iter_postorder` 时只测试装饰器
+"""
+
+import sys
+import time
+
+sys.path.insert(0, sys.argv[1] if len(sys.argv) > 1 else "..")
+from vue2img import util
+
+
+class Node:
+    def __init__(self):
+        self.childNodes = list()
+
+
+def build(total: int, width: int = 8) -> Node:
+    "每个节点最多 width 个子节点的树"
+
+    nodes = [Node()]
+    for i in range(1, total):
+        node = Node()
+        nodes[(i - 1) // width].childNodes.append(node)
+        nodes.append(node)
+    return nodes[0]
+
+
+def measure(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def decorator(travel):
+    def run(root: Node):
+        @travel(root)
+        class _(util.Travel):
+            @staticmethod
+            def preorder(node, depth, parent): ...
+
+            @staticmethod
+            def postorder(node, depth, parent): ...
+    return run
+
+
+if __name__ == "__main__":
+    cases = {"bfs": decorator(util.bfs), "dfs": decorator(util.dfs)}
+    for name in ("iter_preorder", "iter_postorder"):
+        if hasattr(util, name):
+            cases[name] = lambda root, it=getattr(util, name): sum(1 for _ in it(root))
+
+    print("nodes".ljust(8) + "".join(name.rjust(16) for name in cases))
+    for total in (1000, 10000, 100000):
+        root = build(total)
+        row = [f"{measure(lambda: run(root)) * 1000:.1f}ms" for run in cases.values()]
+        print(str(total).ljust(8) + "".join(r.rjust(16) for r in row))
@@ -0,0 +1,105 @@
+"""
+每秒刷新的数据面板 对比完整渲染与 `Template.update()` 局部更新 以及整张绘制与 `createApp.update()` 局部重绘
+
+在 ./benchmark 目录下运行 `python update.py 字体路径 [卡片数]`
+"""
+
+import json
+import sys
+import time
+
+sys.path.append("..")
+from PIL import ImageChops
+
+from vue2img import Template, createApp
+
+
+def template(cells: int, font: str) -> str:
+    items = "".join(f'<div class="cell"><span>指标 {i}：</span><span class="value">{{{{ v{i} }}}}</span></div>' for i in range(cells))
+    return f"""
+<template>
+  <div class="panel">{items}</div>
+</template>
+<style>
+.panel {{ display: grid; grid-template-columns: 1fr 1fr 1fr 1fr; padding: 16px; font-family: "{font}"; }}
+.cell {{ margin: 4px; padding: 8px; background-color: #F6F6F6; }}
+.value {{ font-size: 24px; }}
+</style>
+"""
+
+
+class Dashboard(Template):
+    def data(self, cells: int = 0, tick: int = 0):
+        return {f"v{i}": i * 100 + tick for i in range(cells)}
+
+
+def branch(font: str) -> str:
+    "隐藏分支中的插值 分支不在树中时文字变化不能触发排版"
+
+    return f"""
+<template>
+  <div class="panel">
+    <div v-if="show"><p>{{{{ msg }}}}</p></div>
+    <p v-else>暂无消息</p>
+  </div>
+</template>
+<style>
+.panel {{ font-family: "{font}"; }}
+</style>
+"""
+
+
+class Branch(Template):
+    def data(self, show: bool = False, msg: str = ""):
+        return {"show": show, "msg": msg}
+
+
+if __name__ == "__main__":
+    font = sys.argv[1]
+    cells = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    vue = template(cells, font)
+    Dashboard(vue, cells=cells)  # 预热编译和文字缓存
+
+    start = time.perf_counter()
+    App = Dashboard(vue, cells=cells)
+    print(f"full render: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    start = time.perf_counter()
+    App.update(v0=123456789)
+    print(f"update 1 key: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    changes = {f"v{i}": i for i in range(0, cells, 10)}
+    start = time.perf_counter()
+    App.update(**changes)
+    print(f"update {len(changes)} keys: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    class Expected(Dashboard):
+        def data(self):
+            data = super().data(cells)
+            data["v0"] = 123456789
+            data.update(changes)
+            return data
+
+    print("same as full render:", json.dumps(App.box_tree()) == json.dumps(Expected(vue).box_tree()))
+
+    hidden = Branch(branch(font))
+    hidden.update(msg="hello")  # 文字在隐藏分支中从空变为非空
+    hidden.update(show=True)
+    print("hidden branch:", json.dumps(hidden.box_tree()) == json.dumps(Branch(branch(font), show=True, msg="hello").box_tree()))
+
+    start = time.perf_counter()
+    app = createApp(Dashboard(vue, cells=cells)).mount().export()
+    print(f"full paint: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    start = time.perf_counter()
+    canvas, regions = app.update(v0=123456789)
+    area = sum((r - l) * (b - t) for l, t, r, b in regions) / (canvas.width * canvas.height)
+    print(f"repaint 1 key: {(time.perf_counter() - start) * 1000:.1f}ms  damaged: {area:.2%}")
+
+    start = time.perf_counter()
+    canvas, regions = app.update(**changes)
+    area = sum((r - l) * (b - t) for l, t, r, b in regions) / (canvas.width * canvas.height)
+    print(f"repaint {len(changes)} keys: {(time.perf_counter() - start) * 1000:.1f}ms  damaged: {area:.2%}")
+
+    expected = createApp(Expected(vue)).mount().export().canvas
+    print("same as full paint:", ImageChops.difference(canvas, expected).getbbox() is None)
@@ -1,12 +1,18 @@
 from typing import List
 from .app import Plugin, createApp, image
 from .attribute import *
+from .compiler import Compiled, VNode, VText
+from .display import Blit, Clip, DisplayList, Fill, Op, PaintStats, Text, Tile
 from .dom import *
-from .manager import FontManager
+from .expression import lengthCache
+from .flat import FlatTree
+from .manager import FontManager, FontMetrics
 from .operation import getCuttedBody, radiusMask, word2cloud
+from .raster import memoize, rasterCache, rasterSeen, Rasterizer
 from .style import *
 from .template import Template
-from .util import bfs, dfs, Travel
+from .text import TextLayout, textLayoutCache
+from .util import bfs, dfs, iter_postorder, iter_preorder, LRUCache, Travel
 
 
 def getComputedStyle(dom: DOM):
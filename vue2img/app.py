@@ -1,10 +1,10 @@
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import List, Optional, Tuple
 
 from PIL import Image, ImageDraw
 
-from .util import bfs, Travel
-from .dom import DOM
+from .display import Box, DisplayList, PaintStats, Tile, merge_boxes
+from .raster import Rasterizer
 from .template import Template
 
 
@@ -30,19 +30,42 @@ class createApp:
         "绑定图片"
 
         content = self.App.root.content
+        self.resizable = canvas is None
         self.canvas = canvas if canvas is not None else image(width=content.width, height=content.height)
+        # 未绘制的画布 局部重绘时用它清除旧内容
+        self.blank = self.canvas.copy()
+        # 上次绘制的显示列表 只剔除了空指令 保留每个节点的指令用来比较差异
+        self.display: Optional[DisplayList] = None
+        # 上次绘制的统计 剔除、缓存和实际重放的指令数
+        self.stats: Optional[PaintStats] = None
+        # 上次绘制没有找到重复的子树时 下次绘制跳过子树位图 跳过一次后重新尝试
+        self.memoizing = True
         return self
 
+    def compile(self, stats: Optional[PaintStats] = None) -> DisplayList:
+        "编译显示列表 并剔除不会改动画布的指令"
+
+        return DisplayList.compile(self.App.root, self.draw).cull(self.canvas.size, stats)
+
     def export(self, fp: str = None):
         "导出图片"
 
         # 创建画笔
         self.draw = ImageDraw.Draw(self.canvas)
 
-        # 绘制
-        @bfs(self.App.root)
-        def _(dom: DOM, depth: int, parent: DOM):
-            dom.paste(self.canvas, self.draw)
+        # 绘制 可以整体缓存的子树换成位图 相邻文字合并后重放
+        self.stats = PaintStats()
+        self.display = self.compile(self.stats)
+        memoized = self.display
+        if self.memoizing:
+            rasterizer = Rasterizer(self.App.root, self.display)
+            memoized = rasterizer.memoize()
+            self.memoizing = rasterizer.repeated > 0
+        else:
+            self.memoizing = True
+        tiles = sum(isinstance(op, Tile) for op in memoized.ops)
+        self.stats.memoized = len(self.display) - (len(memoized) - tiles)
+        self.stats.painted = memoized.merge_text().replay(self.canvas, self.draw)
 
         # 保存画布
         if fp is not None:
@@ -50,10 +73,43 @@ class createApp:
 
         return self
 
+    def update(self, **changes) -> Tuple[Image.Image, List[Box]]:
+        """
+        更新数据并局部重绘
+
+        比较前后两次的显示列表 不同指令的新旧区域都算作损坏 只清除并重放与损坏区域相交的指令
+
+        返回画布和重绘的矩形 (left, top, right, bottom)
+        """
+
+        self.App.update(**changes)
+
+        content = self.App.root.content
+        if self.resizable and self.canvas.size != (int(content.width), int(content.height)):
+            # 尺寸变了 换一张画布
+            self.mount()
+        if self.display is None:
+            # 没画过 整张画
+            self.export()
+            return self.canvas, [(0, 0, *self.canvas.size)]
+
+        self.stats = PaintStats()
+        old, new = self.display, self.compile(self.stats)
+        regions = merge_boxes(old.diff(new), self.canvas.size)
+
+        # 每个区域从空白画布切一块 重放相交的指令再贴回去
+        for region in regions:
+            tile = self.blank.crop(region)
+            self.stats.painted += new.replay(tile, ImageDraw.Draw(tile), region[:2], region)
+            self.canvas.paste(tile, region[:2])
+
+        self.display = new
+        return self.canvas, regions
+
     def show(self):
         "展示图片"
 
         self.export()
         self.canvas.show()
 
-        return self
\ No newline at end of file
+        return self
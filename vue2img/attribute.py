@@ -1,6 +1,9 @@
-import re
+from copy import copy
 from inspect import isclass
-from typing import Dict, List, Tuple, Type
+from typing import Dict, List, Optional, Tuple, Type
+
+from .expression import compile_length
+from .util import LRUCache
 
 
 def calcToFloat(expr: str, font_size: float = 16, compared_value: float = 0) -> float:
@@ -17,25 +20,10 @@ def calcToFloat(expr: str, font_size: float = 16, compared_value: float = 0) ->
 
     https://blog.csdn.net/weixin_48644617/article/details/123862697
 
-    当你想用正则解决一个问题 你就有了两个问题
+    表达式会被编译并缓存 详见 `expression.compile_length()`
     """
 
-    expr = expr.replace("px", "").replace("calc", "")
-
-    for value in re.findall(u"[\d\.]+(?:em|%)", expr):
-        value: str
-        if value.endswith("em"):
-            nv = float(value[:-2]) * font_size
-            expr = expr.replace(value, str(nv))
-        elif value.endswith("%"):
-            nv = float(value[:-1]) * compared_value / 100
-            expr = expr.replace(value, str(nv))
-
-    try:
-        result: float = eval(expr)  # 这里还是用 eval 方便啊 感觉没有安全隐患 除非你自己给自己的模板里加炸弹
-        return result
-    except Exception as e:
-        raise Exception(f"{e}: 你传的 {expr} 是牛魔啊")
+    return compile_length(expr)(font_size, compared_value)
 
 
 def setting(initial: str = "0px", inherited: bool = False, compared: Tuple[str] = None):
@@ -52,6 +40,8 @@ def setting(initial: str = "0px", inherited: bool = False, compared: Tuple[str]
 
 class Attribute:
     "样式属性"
+
+    __slots__ = ("_value", "_resolved", "important", "original", "_expressions")
     
     initial = "0px"
     inherited = False
@@ -71,6 +61,7 @@ class Attribute:
         """
 
         self._value = None
+        self._resolved: Optional[Dict[tuple, Attribute]] = None
         self.important = "!important" in value
 
         if value == "initial":
@@ -88,6 +79,7 @@ class Attribute:
 
         self.original = self.initial
         self._expressions = self.split()
+        self._resolved = None
         return self
 
     @property
@@ -176,6 +168,25 @@ class Attribute:
 
         return self.completion(expr)
 
+    def resolve(self, *args) -> "Attribute":
+        """
+        写时复制地调用 `transform()` 自身不会被修改
+
+        同一属性相同参数的计算结果会被缓存 多个节点共享同一个结果
+        """
+
+        if self._resolved is None:
+            self._resolved = dict()
+        attr = self._resolved.get(args)
+        if attr is None:
+            if len(self._resolved) >= 64:
+                self._resolved.clear()
+            attr = copy(self)
+            attr._resolved = None
+            attr.transform(*args)
+            self._resolved[args] = attr
+        return attr
+
     def transform(self, font_size: float = 16, compared_value: float = 0):
         "将表达式中 calc() rgb() 等函数转换为标准值"
 
@@ -186,6 +197,8 @@ class Attribute:
 class Attribute2(Attribute):
     "2 值属性"
 
+    __slots__ = ()
+
     @property
     def value(self) -> Tuple[float, float]:
         return super().value
@@ -213,6 +226,8 @@ class Attribute2(Attribute):
 class Attribute4(Attribute2):
     "4 值属性"
 
+    __slots__ = ()
+
     @property
     def value(self) -> Tuple[float, float, float, float]:
         return super().value
@@ -240,6 +255,8 @@ class Attribute4(Attribute2):
 class Attribute8(Attribute4):
     "8 值属性"
 
+    __slots__ = ()
+
     @property
     def value(self) -> Tuple[float, float, float, float, float, float, float, float]:
         return super().value
@@ -261,6 +278,8 @@ class Attribute8(Attribute4):
 class AttributeAll(Attribute):
     "不定值属性"
 
+    __slots__ = ()
+
     @property
     def value(self) -> Tuple[float, ...]:
         return super().value
@@ -277,6 +296,8 @@ class AttributeAll(Attribute):
 class AttributeText(Attribute):
     "文本属性"
 
+    __slots__ = ()
+
     @property
     def value(self) -> str:
         return super().value
@@ -287,11 +308,15 @@ class AttributeText(Attribute):
 
 @setting("16px", True, ("parent.fontSize",))
 class FontSize(Attribute):
+    __slots__ = ()
+
     def transform(self, parent_font_size: float = 16):
         super().transform(parent_font_size, parent_font_size)
 
 
 class Padding(Attribute4):
+    __slots__ = ("top", "right", "bottom", "left")
+
     def transform(self, font_size: float = 16, compared_value: float = 0):
         super().transform(font_size, compared_value)
         self.top, self.right, self.bottom, self.left = self.value
@@ -309,11 +334,14 @@ class Padding(Attribute4):
         return self.top + self.bottom
 
 
-class Margin(Padding): ...
+class Margin(Padding):
+    __slots__ = ()
 
 
 @setting("auto", compared=("fontSize", "parent.width", "side"))
-class Width(Attribute):    
+class Width(Attribute):
+    __slots__ = ()
+
     def transform(self, font_size: float = 16, compared_value: float = 0, side: float = 0):
         "当 width 为 auto 时值会设为父元素减去梓神 margin padding (border) 左右两侧"
 
@@ -326,6 +354,8 @@ class Width(Attribute):
 
 @setting("auto", compared=("fontSize", "parent.height"))
 class Height(Attribute):
+    __slots__ = ()
+
     def transform(self, font_size: float = 16, compared_value: float = 0):
         val, = self.expressions
         if val == "auto":
@@ -336,6 +366,11 @@ class Height(Attribute):
 
 @setting(compared=("fontSize", "width", "height"))
 class BorderRadius(Attribute8):
+    __slots__ = (
+        "topLeftX", "topRightX", "bottomRightX", "bottomLeftX",
+        "topLeftY", "topRightY", "bottomRightY", "bottomLeftY",
+    )
+
     def transform(self, font_size: float = 16, width: float = 0.0, height: float = 0.0):
         if height is None:
             height = width
@@ -347,6 +382,8 @@ class BorderRadius(Attribute8):
 
 @setting("", compared=("fontSize", "width", "gridGap"))
 class GridTemplateColumns(AttributeAll):
+    __slots__ = ("gridTotal", "gridNum")
+
     def transform(self, font_size: float = 0.0, width: float = 0.0, gridGap: Tuple[float] = (0.0, 0.0)):
         fr = 0
         static = 0
@@ -361,11 +398,12 @@ class GridTemplateColumns(AttributeAll):
                 values.append(n)
 
         self.gridTotal = len(self.expressions)
-        nw = width - static - (self.gridTotal - 1) * gridGap[0]
+        # gap 的第二个值是列间距
+        nw = width - static - (self.gridTotal - 1) * gridGap[1]
 
         for i in range(len(values)):
             v = values[i]
-            if v.endswith("fr"):
+            if isinstance(v, str):
                 values[i] = nw * float(v[:-2]) / fr
 
         self._value = tuple(values)
@@ -377,6 +415,8 @@ class GridTemplateColumns(AttributeAll):
 
 @setting(compared=("fontSize", "width", "height"))
 class GridGap(Attribute2):
+    __slots__ = ("row", "column")
+
     def transform(self, font_size: float = 16, width: float = 0.0, height: float = 0.0):
         v0, v1 = self.expressions
         self.row = calcToFloat(v0, font_size, width)
@@ -385,33 +425,46 @@ class GridGap(Attribute2):
 
 
 @setting("black", True)
-class Color(AttributeText): ...
+class Color(AttributeText):
+    __slots__ = ()
 
 
 @setting("#00000000", True)
-class BackgroundColor(AttributeText): ...
+class BackgroundColor(AttributeText):
+    __slots__ = ()
 
 
 @setting("msyh", True)
-class FontFamily(AttributeText): ...
+class FontFamily(AttributeText):
+    __slots__ = ()
 
 
 @setting("block")
-class Display(AttributeText): ...
+class Display(AttributeText):
+    __slots__ = ()
 
 
 @setting("none")
-class Float(AttributeText): ...
+class Float(AttributeText):
+    __slots__ = ()
 
 
 @setting("static")
-class Position(AttributeText): ...
+class Position(AttributeText):
+    __slots__ = ()
 
 
-class Top(Attribute): ...
+@setting("visible")
+class Overflow(AttributeText):
+    __slots__ = ()
 
 
-class Left(Attribute): ...
+class Top(Attribute):
+    __slots__ = ()
+
+
+class Left(Attribute):
+    __slots__ = ()
 
 
 def attribute_types(local: Dict[str, Type[Attribute]]):
@@ -420,23 +473,37 @@ def attribute_types(local: Dict[str, Type[Attribute]]):
         v: Attribute
         if not isclass(v):
             continue
-        # 下面暂时不需要 除非在这里加了非 Attribute 类
-        # if not issubclass(v, Attribute):
-        #     continue
+        if not issubclass(v, Attribute):
+            continue
         ATTRIBUTE_TYPES[v.css()] = v
 
     def warpper(func):
-        def inner(cmd: str) -> Attribute:
-            "解析属性语句"
+        def inner(cmd: str, value: Optional[str] = None) -> Attribute:
+            """
+            解析属性语句 也可以分别传入属性名和值
+
+            相同的声明只解析一次 返回共享的属性原型 不要直接修改它 需要计算时用 `resolve()`
+            """
 
-            name, value = cmd.split(":")
-            attr = ATTRIBUTE_TYPES.get(name.strip())
+            if value is None:
+                name, _, value = cmd.partition(":")
+            else:
+                name = cmd
+            key = (name.strip(), value.strip())
+            attr = attributeCache.get(key)
             if attr is None:
-                raise Exception(f"{name} 属性暂不支持")
-            return attr(value=value.strip())
+                cls = ATTRIBUTE_TYPES.get(key[0])
+                if cls is None:
+                    raise Exception(f"{name} 属性暂不支持")
+                attr = attributeCache.set(key, cls(value=key[1]))
+            return attr
         return inner
     return warpper
 
 
+# 属性原型缓存 命中次数即节省的解析次数
+attributeCache: LRUCache = LRUCache(4096)
+
+
 @attribute_types(locals())
-def makeAttribute(cmd: str) -> Attribute: ...
\ No newline at end of file
+def makeAttribute(cmd: str, value: Optional[str] = None) -> Attribute: ...
\ No newline at end of file
@@ -0,0 +1,184 @@
+import re
+from dataclasses import dataclass
+from hashlib import sha1
+from typing import Dict, List, Optional, Tuple, Union
+
+from lxml.etree import HTML, HTMLParser
+from lxml.etree import _Element as Element
+
+from .css import iter_rules
+from .selector import RuleIndex
+from .style import Style
+from .util import LRUCache, Travel, dfs
+
+varsPattern = re.compile(r"{{(.*?)}}")
+
+# 默认解析器最多嵌套 256 层 huge_tree 可以放宽到 libxml2 的上限
+htmlParser = HTMLParser(huge_tree=True)
+
+
+@dataclass(frozen=True, eq=False)
+class VText:
+    """
+    编译后的文字节点
+
+    text: 原始文字 含有 `{{ }}` 插值
+
+    keys: 插值依赖的 `data()` 键 为空说明是静态文字
+    """
+
+    text: str
+    keys: Tuple[str, ...] = tuple()
+
+
+@dataclass(frozen=True, eq=False)
+class VNode:
+    """
+    编译后的元素节点 渲染时不会被修改 可以被多次渲染共享
+
+    attributes: 按原顺序排列的 (属性名, 值, 是否绑定) 绑定属性的值是 `data()` 键
+
+    inner_style: 行内样式
+
+    tag_rules, class_rules, id_rules: 匹配到的各层选择器样式 按样式表顺序排列
+    """
+
+    tag: str
+    attributes: Tuple[Tuple[str, str, bool], ...] = tuple()
+    inner_style: Style = None
+    tag_rules: Tuple[Style, ...] = tuple()
+    class_rules: Tuple[Style, ...] = tuple()
+    id_rules: Tuple[Style, ...] = tuple()
+    children: Tuple[Union["VNode", VText], ...] = tuple()
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        "节点属性依赖的 `data()` 键"
+
+        return tuple(v for _, v, bound in self.attributes if bound)
+
+
+@dataclass(frozen=True, eq=False)
+class Compiled:
+    """
+    编译后的模板 与 `data()` 无关
+
+    root: 根节点
+
+    template: 原 `<template>` 元素 供 `Template.cssselect()` 使用
+
+    elements: 元素到编译节点的映射
+    """
+
+    root: VNode
+    script: str
+    style: str
+    template: Element
+    elements: Dict[Element, VNode]
+
+
+def parse_attributes(ele: Element) -> Tuple[Tuple[str, str, bool], ...]:
+    "解析元素属性"
+
+    attributes = []
+    for k, v in ele.items():
+        k: str
+        v: str
+        if k == "style":
+            continue
+        if k[0] == ":":
+            attributes.append((k[1:], v, True))
+        elif k in ["v-if", "v-else-if"]:
+            attributes.append((k, v, True))
+        elif k == "v-for":
+            # 你猜我什么时候支持这个命令
+            continue
+        else:
+            attributes.append((k, v, False))
+    return tuple(attributes)
+
+
+# 进程内共享的样式缓存 缓存中的 `Style` 不会被修改 可以放心共享
+stylesheet_cache: LRUCache = LRUCache(128)
+declaration_cache: LRUCache = LRUCache(2048)
+
+
+def parse_block(block: Optional[str]) -> Style:
+    "解析声明块 结果会被缓存"
+
+    block = "" if block is None else block.strip()
+    return declaration_cache.fetch(block, lambda: Style.parse_style(block))
+
+
+def parse_stylesheet(style: str) -> RuleIndex:
+    "解析样式表 建立规则索引 以样式表文本的哈希为键缓存"
+
+    def factory():
+        index = RuleIndex()
+        for rule in iter_rules(style):
+            block = rule.block.strip()
+            index.add(rule.selectors, declaration_cache.fetch(block, lambda: Style.from_declarations(rule.declarations)))
+        return index
+    return stylesheet_cache.fetch(sha1(style.encode("utf-8")).hexdigest(), factory)
+
+
+def compile(vue: str, width: str = "1000px", font_size: str = "16px") -> Compiled:
+    """
+    ### 编译模板
+
+    解析 html 结构、拆分样式表并完成选择器匹配
+
+    得到的 `Compiled` 只读 可以配合不同 `data()` 反复渲染
+    """
+
+    # 获取 template script style
+    html: Element = HTML(vue, parser=htmlParser)
+    template: Element = html.find("body/template")
+    script: str = html.findtext("body/script")
+    style: str = html.findtext("body/style") or ""
+
+    # 根节点样式
+    template.set("style", f"width: {width};font-size: {font_size};")
+
+    matched = parse_stylesheet(style).match(template)
+    children: Dict[Element, List[Union[VNode, VText]]] = dict()
+    elements: Dict[Element, VNode] = dict()
+
+    @dfs(template, lambda node: list(node.xpath("./*|text()")))
+    class _(Travel):
+        "自底向上生成 `VNode` 树"
+
+        @staticmethod
+        def preorder(ele: Union[Element, str], depth: int, parent: Optional[Element]):
+            if isinstance(ele, Element):
+                children[ele] = list()
+                return
+            keys = tuple(var.strip() for var in varsPattern.findall(ele))
+            text = str(ele) if keys else ele.strip()
+            if text != "":
+                children[parent].append(VText(text, keys))
+            return False
+
+        @staticmethod
+        def postorder(ele: Element, depth: int, parent: Optional[Element]):
+            tag_rules, class_rules, id_rules = matched.get(ele, ([], [], []))
+            node = VNode(
+                tag=ele.tag,
+                attributes=parse_attributes(ele),
+                inner_style=parse_block(ele.get("style")),
+                tag_rules=tuple(tag_rules),
+                class_rules=tuple(class_rules),
+                id_rules=tuple(id_rules),
+                children=tuple(children.pop(ele)),
+            )
+            elements[ele] = node
+            if parent is not None:
+                children[parent].append(node)
+
+    return Compiled(
+        root=elements[template],
+        script=script,
+        style=style,
+        template=template,
+        elements=elements,
+    )
@@ -0,0 +1,186 @@
+import re
+from dataclasses import dataclass
+from functools import partial
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# 样式表解析 一遍扫描
+# 简单的规则由 `simpleRulePattern` 整条匹配 其余部分用 `tokenPattern` 找出字符串、括号、大括号和分号逐个处理
+# 字符串和括号里的 `;` `{` `}` 不会切断声明 `@media` 等 @ 规则的块和规则中嵌套的块整体跳过
+
+commentPattern = re.compile(r"/\*.*?(?:\*/|\Z)", re.S)
+quotedCommentPattern = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|/\*.*?(?:\*/|\Z)", re.S)
+tokenPattern = re.compile(r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|[;{}()]", re.S)
+# 没有字符串、嵌套括号、括号中的分号和嵌套块的规则 占绝大多数 整条匹配后直接按分号切分
+simpleRulePattern = re.compile(r"([^;{}()\"'@]*)\{([^{}()\"']*(?:\([^;{}()\"']*\)[^{}()\"']*)*)\}")
+simpleBlockPattern = re.compile(r"[^{}()\"']*(?:\([^;{}()\"']*\)[^{}()\"']*)*")
+
+
+class Declaration(NamedTuple):
+    "声明 例如 `margin: 0 auto !important`"
+
+    name: str
+    value: str
+
+    @property
+    def important(self) -> bool:
+        return "!important" in self.value
+
+
+# 绕过 NamedTuple 在 Python 层的构造函数 批量生成声明时更快
+newDeclaration = partial(tuple.__new__, Declaration)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    规则
+
+    selectors: 选择器 逗号分隔的选择器组保持原样
+
+    declarations: 声明
+
+    block: 声明块原文 可以作为缓存的键
+    """
+
+    selectors: str
+    declarations: Tuple[Declaration, ...]
+    block: str
+
+
+def strip_comments(text: str) -> str:
+    "去掉注释 字符串里的 `/*` 保持原样"
+
+    if "/*" not in text:
+        return text
+    if "\"" not in text and "'" not in text:
+        return commentPattern.sub("", text)
+    return quotedCommentPattern.sub(lambda m: m.group(1) or "", text)
+
+
+def append_declaration(declarations: List[Declaration], text: str):
+    "解析一条声明 没有冒号或者名字、值为空时跳过"
+
+    name, colon, value = text.partition(":")
+    if colon:
+        name, value = name.strip(), value.strip()
+        if name and value:
+            declarations.append(newDeclaration((name, value)))
+
+
+def split_declarations(text: str) -> List[Declaration]:
+    "解析字符串和括号中都没有分号的声明块 直接按分号切分"
+
+    declarations: List[Declaration] = list()
+    for item in text.split(";"):
+        name, colon, value = item.partition(":")
+        if colon:
+            name, value = name.strip(), value.strip()
+            if name and value:
+                declarations.append(newDeclaration((name, value)))
+    return declarations
+
+
+def parse_declarations(text: str) -> List[Declaration]:
+    "解析声明块 例如行内样式"
+
+    text = strip_comments(text)
+    declarations: List[Declaration] = list()
+    if simpleBlockPattern.fullmatch(text):
+        return split_declarations(text)
+    start = parens = 0
+    for m in tokenPattern.finditer(text):
+        c = m.group()
+        if c == ";":
+            if parens == 0:
+                append_declaration(declarations, text[start:m.start()])
+                start = m.end()
+        elif c == "(":
+            parens += 1
+        elif c == ")":
+            parens = max(parens - 1, 0)
+    append_declaration(declarations, text[start:])
+    return declarations
+
+
+def scan(text: str, pos: int) -> Tuple[Optional[Rule], int]:
+    """
+    从 pos 开始逐个记号扫描 直到一条规则、一个 @ 规则或者一条语句结束
+
+    返回规则和结束位置 @ 规则、规则外的语句和没有声明的规则返回 None
+    """
+
+    start, parens, skip = pos, 0, 0
+    selectors = None  # 当前规则的选择器 不在规则中时为 None
+    opened = 0  # 声明块的起点
+    declarations: List[Declaration] = list()
+    for m in tokenPattern.finditer(text, pos):
+        c = m.group()
+        if skip:
+            # 跳过的块 只数大括号
+            if c == "{":
+                skip += 1
+            elif c == "}":
+                skip -= 1
+                if skip == 0 and selectors is None:
+                    return None, m.end()
+                if skip == 0:
+                    start = m.end()
+        elif c == ";":
+            if parens:
+                continue
+            if selectors is None:
+                # 规则外的分号结束 `@import` 等语句
+                return None, m.end()
+            append_declaration(declarations, text[start:m.start()])
+            start = m.end()
+        elif c == "{":
+            parens = 0
+            skip = 1
+            if selectors is not None:
+                continue  # 规则中嵌套的块
+            prelude = text[start:m.start()].strip()
+            if prelude == "" or prelude[0] == "@":
+                continue  # @ 规则的块
+            selectors, opened, start, skip = prelude, m.end(), m.end(), 0
+        elif c == "}":
+            if selectors is None:
+                return None, m.end()
+            append_declaration(declarations, text[start:m.start()])
+            return (Rule(selectors, tuple(declarations), text[opened:m.start()]) if declarations else None), m.end()
+        elif c == "(":
+            parens += 1
+        elif c == ")":
+            parens = max(parens - 1, 0)
+    # 没有闭合的规则到结尾为止
+    if selectors is not None:
+        append_declaration(declarations, text[start:])
+        if declarations:
+            return Rule(selectors, tuple(declarations), text[opened:]), len(text)
+    return None, len(text)
+
+
+def iter_rules(text: str) -> Iterator[Rule]:
+    "解析样式表 @ 规则和规则中嵌套的块会被跳过"
+
+    text = strip_comments(text)
+    pos, end = 0, len(text)
+    while pos < end:
+        m = simpleRulePattern.match(text, pos)
+        if m is None:
+            # 带有字符串、括号、@ 规则等的部分逐个记号扫描
+            rule, pos = scan(text, pos)
+            if rule is not None:
+                yield rule
+            continue
+        selectors, block = m.groups()
+        pos = m.end()
+        declarations = split_declarations(block)
+        selectors = selectors.strip()
+        if declarations and selectors:
+            yield Rule(selectors, tuple(declarations), block)
+
+
+def parse_rules(text: str) -> List[Rule]:
+    "解析样式表 返回所有规则"
+
+    return list(iter_rules(text))
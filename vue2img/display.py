@@ -0,0 +1,492 @@
+import hashlib
+import weakref
+from dataclasses import dataclass, field, replace
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from .operation import radiusMask
+from .util import bfs
+
+if TYPE_CHECKING:
+    from .dom import DOM
+
+Box = Tuple[int, int, int, int]
+
+
+def intersect(a: Box, b: Box) -> bool:
+    "两个 (left, top, right, bottom) 矩形是否相交"
+
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def merge_boxes(boxes: List[Box], size: Tuple[int, int]) -> List[Box]:
+    "裁剪到画布内 并把相交的矩形合并为外接矩形 合并后的矩形两两不相交"
+
+    merged: List[Box] = list()
+    for left, top, right, bottom in boxes:
+        box = (max(left, 0), max(top, 0), min(right, size[0]), min(bottom, size[1]))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            continue
+        i = 0
+        while i < len(merged):
+            if intersect(merged[i], box):
+                other = merged.pop(i)
+                box = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                i = 0
+            else:
+                i += 1
+        merged.append(box)
+    return merged
+
+
+# 图片内容指纹 以对象 id 为键 图片被回收时删除 同一张图片只计算一次
+imageDigests: Dict[int, Tuple[Tuple[int, int], str, bytes]] = dict()
+
+
+def image_digest(image: Image.Image) -> Tuple[Tuple[int, int], str, bytes]:
+    "图片内容指纹 (尺寸, 模式, 像素摘要) 不持有图片"
+
+    key = id(image)
+    digest = imageDigests.get(key)
+    if digest is None:
+        digest = (image.size, image.mode, hashlib.blake2b(image.tobytes(), digest_size=16).digest())
+        imageDigests[key] = digest
+        weakref.finalize(image, imageDigests.pop, key, None)
+    return digest
+
+
+def evolve(instance: "Op", **changes) -> "Op":
+    "与 `dataclasses.replace()` 相同 但不重新调用 `__init__` 生成子树指纹时要平移大量指令"
+
+    result = object.__new__(type(instance))
+    result.__dict__.update(instance.__dict__, **changes)
+    return result
+
+
+@dataclass(frozen=True)
+class Op:
+    """
+    ### 绘制指令
+
+    box: 绘制区域 (left, top, right, bottom) 指令不会改动区域外的像素
+
+    指令可以比较和哈希 相等的指令绘制结果相同
+    """
+
+    box: Box
+
+    def replay(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        "绘制到画布上 origin: 画布左上角对应的绝对坐标"
+
+    def moved(self, dx: int, dy: int) -> "Op":
+        "平移后的指令"
+
+        left, top, right, bottom = self.box
+        return evolve(self, box=(left + dx, top + dy, right + dx, bottom + dy))
+
+    def fingerprint(self, dx: int, dy: int) -> Hashable:
+        "平移后的指纹 用作缓存的键 相等的指纹绘制结果相同 不持有图片"
+
+        return self.moved(dx, dy)
+
+    @property
+    def empty(self) -> bool:
+        "绘制区域为空"
+
+        return self.box[0] >= self.box[2] or self.box[1] >= self.box[3]
+
+    def dump(self, images: List[Image.Image]) -> Dict[str, Any]:
+        "转为可以 `json.dumps()` 的字典 图片放进 images 列表 字典中只记下标"
+
+        return {"op": type(self).__name__.lower(), "box": list(self.box)}
+
+
+@dataclass(frozen=True)
+class Fill(Op):
+    "填充圆角矩形 即节点背景"
+
+    color: str = "#00000000"
+    radius: Tuple[float, float, float, float] = (0, 0, 0, 0)
+
+    @property
+    def transparent(self) -> bool:
+        return ImageColor.getcolor(self.color, "RGBA")[3] == 0
+
+    @property
+    def opaque(self) -> bool:
+        return ImageColor.getcolor(self.color, "RGBA")[3] == 255
+
+    def replay(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        # 大部分容器没有背景色 不用生成背景和遮罩
+        if self.transparent:
+            return
+        left, top, right, bottom = self.box
+        width, height = right - left, bottom - top
+        left, top = left - origin[0], top - origin[1]
+        if any(self.radius):
+            bg = Image.new("RGBA", (width, height), self.color)
+            # 虽然 borderRadius 已经是 8 值属性了 但是 radiusMask 目前只支持四个参数 问就是我懒
+            a = radiusMask(bg.getchannel("A"), self.radius)
+            canvas.paste(bg, (left, top), mask=a)
+            return
+
+        # 没有圆角时只画落在画布内的部分 局部重绘时大容器不用整块生成
+        box = (max(left, 0), max(top, 0), min(left + width, canvas.width), min(top + height, canvas.height))
+        if box[0] < box[2] and box[1] < box[3]:
+            bg = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]), self.color)
+            canvas.paste(bg, box[:2], mask=bg.getchannel("A"))
+
+    def dump(self, images: List[Image.Image]) -> Dict[str, Any]:
+        return {**super().dump(images), "color": self.color, "radius": list(self.radius)}
+
+
+@dataclass(frozen=True)
+class Blit(Op):
+    """
+    按圆角遮罩贴图片
+
+    image 不参与比较 以对象 id 区分 持有指令就持有图片 所以 id 不会被复用
+    """
+
+    image: Image.Image = field(default=None, compare=False, repr=False)
+    radius: Tuple[float, float, float, float] = (0, 0, 0, 0)
+    ident: int = 0
+
+    def __post_init__(self):
+        object.__setattr__(self, "ident", id(self.image))
+
+    def replay(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        a = radiusMask(self.image.getchannel("A"), self.radius)
+        canvas.paste(self.image, (self.box[0] - origin[0], self.box[1] - origin[1]), a)
+
+    def fingerprint(self, dx: int, dy: int) -> Hashable:
+        "以图片内容代替图片 缓存不会因为键留住解码后的图片"
+
+        return Blit, self.moved(dx, dy).box, self.radius, image_digest(self.image)
+
+    def dump(self, images: List[Image.Image]) -> Dict[str, Any]:
+        images.append(self.image)
+        return {**super().dump(images), "image": len(images) - 1, "radius": list(self.radius)}
+
+
+@dataclass(frozen=True)
+class Tile(Op):
+    "贴缓存的子树位图 mask 为圆角遮罩 没有圆角时为空"
+
+    image: Image.Image = field(default=None, compare=False, repr=False)
+    mask: Optional[Image.Image] = field(default=None, compare=False, repr=False)
+    ident: int = 0
+
+    def __post_init__(self):
+        object.__setattr__(self, "ident", id(self.image))
+
+    def replay(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        canvas.paste(self.image, (self.box[0] - origin[0], self.box[1] - origin[1]), self.mask)
+
+    def dump(self, images: List[Image.Image]) -> Dict[str, Any]:
+        data = super().dump(images)
+        images.append(self.image)
+        data["image"] = len(images) - 1
+        data["mask"] = None
+        if self.mask is not None:
+            images.append(self.mask)
+            data["mask"] = len(images) - 1
+        return data
+
+
+@dataclass(frozen=True)
+class Text(Op):
+    """
+    文字
+
+    runs: 若干段 ((left, top), 文字) 相邻的同色同字体文字会合并成一条指令
+
+    font 不参与比较 以 (路径, 字号) 区分
+    """
+
+    runs: Tuple[Tuple[Tuple[int, int], str], ...] = tuple()
+    color: str = "black"
+    font: ImageFont.FreeTypeFont = field(default=None, compare=False, repr=False)
+    face: Tuple[str, int] = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "face", (self.font.path, self.font.size))
+
+    def replay(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        for (left, top), text in self.runs:
+            draw.text((left - origin[0], top - origin[1]), text, self.color, self.font)
+
+    def moved(self, dx: int, dy: int) -> "Op":
+        runs = tuple(((left + dx, top + dy), text) for (left, top), text in self.runs)
+        return evolve(super().moved(dx, dy), runs=runs)
+
+    @property
+    def empty(self) -> bool:
+        return super().empty or all(text == "" for _, text in self.runs)
+
+    def dump(self, images: List[Image.Image]) -> Dict[str, Any]:
+        return {
+            **super().dump(images),
+            "runs": [[list(xy), text] for xy, text in self.runs],
+            "color": self.color,
+            "font": {"path": self.font.path, "size": self.font.size},
+        }
+
+
+@dataclass(frozen=True)
+class Clip(Op):
+    """
+    裁剪 只在 box 内绘制 op 用于 overflow: hidden 容器的子孙
+
+    box 为 op 的绘制区域与容器背景矩形的交集
+    """
+
+    op: Op = None
+
+    def replay(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        left, top, right, bottom = self.box
+        region = (max(left - origin[0], 0), max(top - origin[1], 0), min(right - origin[0], canvas.width), min(bottom - origin[1], canvas.height))
+        if region[0] >= region[2] or region[1] >= region[3]:
+            return
+        # 在切片上绘制再贴回 切片外的像素不会被改动
+        tile = canvas.crop(region)
+        self.op.replay(tile, ImageDraw.Draw(tile), (origin[0] + region[0], origin[1] + region[1]))
+        canvas.paste(tile, region[:2])
+
+    def moved(self, dx: int, dy: int) -> "Op":
+        return evolve(super().moved(dx, dy), op=self.op.moved(dx, dy))
+
+    def fingerprint(self, dx: int, dy: int) -> Hashable:
+        return Clip, super().moved(dx, dy).box, self.op.fingerprint(dx, dy)
+
+    def dump(self, images: List[Image.Image]) -> Dict[str, Any]:
+        return {**super().dump(images), "inner": self.op.dump(images)}
+
+
+def clip(op: Op, box: Optional[Box]) -> Op:
+    "把指令限制在 box 内 完全在 box 内时原样返回"
+
+    if box is None:
+        return op
+    a = op.box
+    if box[0] <= a[0] and box[1] <= a[1] and a[2] <= box[2] and a[3] <= box[3]:
+        return op
+    return Clip((max(a[0], box[0]), max(a[1], box[1]), min(a[2], box[2]), min(a[3], box[3])), op)
+
+
+@dataclass
+class PaintStats:
+    """
+    ### 绘制统计
+
+    每个节点编译出一条指令 所以也是节点数
+
+    compiled: 编译出的指令
+
+    transparent: 全透明的背景
+
+    empty: 面积为零的矩形和空文字
+
+    offscreen: 完全在画布外
+
+    clipped: 被 overflow: hidden 的祖先完全裁掉
+
+    memoized: 随子树位图一起贴上 没有单独绘制
+
+    painted: 实际重放的指令 合并的文字算一条
+    """
+
+    compiled: int = 0
+    transparent: int = 0
+    empty: int = 0
+    offscreen: int = 0
+    clipped: int = 0
+    memoized: int = 0
+    painted: int = 0
+
+    @property
+    def skipped(self) -> int:
+        "剔除的指令"
+
+        return self.transparent + self.empty + self.offscreen + self.clipped
+
+
+class DisplayList:
+    """
+    ### 显示列表
+
+    排版完成后按绘制顺序展开的绘制指令 可以优化、缓存、重放到多张画布上 也可以比较两次渲染的差异
+
+    ops: 指令
+
+    owners: 每条指令来自哪个节点 优化子树时使用 不参与比较和序列化
+    """
+
+    def __init__(self, ops: List[Op], owners: Optional[List["DOM"]] = None):
+        self.ops = ops
+        self.owners = owners if owners is not None else [None] * len(ops)
+
+    @classmethod
+    def compile(cls, root: "DOM", draw: ImageDraw.ImageDraw) -> "DisplayList":
+        "按 `createApp.export()` 的广度优先顺序收集每个节点的指令"
+
+        ops: List[Op] = list()
+        owners: List["DOM"] = list()
+        # 每个节点的子孙需要裁剪到的矩形 即 overflow: hidden 祖先背景矩形的交集
+        clips: Dict["DOM", Optional[Box]] = dict()
+        # 每个节点的 absolute 子孙的包含块 即最近的定位祖先 没有时是根节点
+        containers: Dict["DOM", "DOM"] = dict()
+
+        @bfs(root)
+        def _(dom: "DOM", depth: int, parent: "DOM"):
+            position = dom.style.position
+            containers[dom] = dom if parent is None or position.equal("relative", "absolute", "fixed", "sticky") else containers[parent]
+            # absolute 节点只受包含块及其祖先的 overflow: hidden 裁剪 包含块在裁剪容器外时不裁剪
+            box = clips.get(containers[parent] if parent is not None and position.equal("absolute") else parent)
+            for op in dom.display(draw):
+                ops.append(clip(op, box))
+                owners.append(dom)
+            if dom.style.overflow.equal("hidden"):
+                background = dom.content.background
+                left, top = background.xy
+                width, height = background.size
+                inner = (left, top, left + width, top + height)
+                if box is not None:
+                    inner = (max(inner[0], box[0]), max(inner[1], box[1]), min(inner[2], box[2]), min(inner[3], box[3]))
+                box = inner
+            if box is not None:
+                clips[dom] = box
+
+        return cls(ops, owners)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self) -> Iterator[Op]:
+        return iter(self.ops)
+
+    def __eq__(self, other: "DisplayList"):
+        return isinstance(other, DisplayList) and self.ops == other.ops
+
+    def cull(self, size: Optional[Tuple[int, int]] = None, stats: Optional[PaintStats] = None) -> "DisplayList":
+        """
+        ### 剔除
+
+        去掉不会改动任何像素的指令 全透明的背景、空矩形、空文字、被 overflow: hidden 完全裁掉的子孙
+
+        size: 画布尺寸 传入时还会去掉完全在画布外的指令
+
+        stats: 传入时累加各类被剔除的指令数
+        """
+
+        if stats is None:
+            stats = PaintStats()
+        stats.compiled += len(self.ops)
+        screen = (0, 0, *size) if size is not None else None
+        ops: List[Op] = list()
+        owners: List["DOM"] = list()
+        for op, dom in zip(self.ops, self.owners):
+            inner = op.op if isinstance(op, Clip) else op
+            if isinstance(inner, Fill) and inner.transparent:
+                stats.transparent += 1
+            elif inner.empty:
+                stats.empty += 1
+            elif op.empty:
+                stats.clipped += 1
+            elif screen is not None and not intersect(op.box, screen):
+                stats.offscreen += 1
+            else:
+                ops.append(op)
+                owners.append(dom)
+        return DisplayList(ops, owners)
+
+    def merge_text(self) -> "DisplayList":
+        "合并前后相邻、颜色字体相同并且区域相交或相接的文字 合并后不再区分来源节点"
+
+        ops: List[Op] = list()
+        for op in self.ops:
+            last = ops[-1] if ops else None
+            if (
+                isinstance(op, Text) and isinstance(last, Text) and op.color == last.color and op.face == last.face
+                and op.box[0] <= last.box[2] and last.box[0] <= op.box[2] and op.box[1] <= last.box[3] and last.box[1] <= op.box[3]
+            ):
+                box = (min(op.box[0], last.box[0]), min(op.box[1], last.box[1]), max(op.box[2], last.box[2]), max(op.box[3], last.box[3]))
+                ops[-1] = replace(last, box=box, runs=last.runs + op.runs)
+            else:
+                ops.append(op)
+        return DisplayList(ops)
+
+    def replay(self, canvas: Image.Image, draw: Optional[ImageDraw.ImageDraw] = None, origin: Tuple[int, int] = (0, 0), region: Optional[Box] = None) -> int:
+        """
+        ### 重放
+
+        origin: 画布左上角对应的绝对坐标
+
+        region: 只重放与该绝对坐标矩形相交的指令
+
+        返回重放的指令数
+        """
+
+        if draw is None:
+            draw = ImageDraw.Draw(canvas)
+        count = 0
+        for op in self.ops:
+            if region is None or intersect(op.box, region):
+                op.replay(canvas, draw, origin)
+                count += 1
+        return count
+
+    def diff(self, other: "DisplayList") -> List[Box]:
+        "与另一次渲染的差异 返回两边不同指令的绘制区域 顺序变化也算不同"
+
+        boxes: List[Box] = list()
+        if len(self.ops) == len(other.ops):
+            # 指令数不变时多半只是内容变了 逐条对比即可
+            for a, b in zip(self.ops, other.ops):
+                if a != b:
+                    boxes.append(a.box)
+                    boxes.append(b.box)
+            return boxes
+        matcher = SequenceMatcher(None, self.ops, other.ops, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                boxes.extend(op.box for op in self.ops[i1:i2])
+                boxes.extend(op.box for op in other.ops[j1:j2])
+        return boxes
+
+    def dump(self) -> Tuple[List[Dict[str, Any]], List[Image.Image]]:
+        "转为可以 `json.dumps()` 的列表 图片单独返回 指令中记录下标"
+
+        images: List[Image.Image] = list()
+        return [op.dump(images) for op in self.ops], images
+
+    @classmethod
+    def load(cls, data: List[Dict[str, Any]], images: List[Image.Image]) -> "DisplayList":
+        "从 `dump()` 的结果还原"
+
+        return cls([load_op(item, images) for item in data])
+
+
+def load_op(item: Dict[str, Any], images: List[Image.Image]) -> Op:
+    "从 `Op.dump()` 的结果还原一条指令"
+
+    from .manager import FontManager
+
+    box = tuple(item["box"])
+    kind = item["op"]
+    if kind == "fill":
+        return Fill(box, item["color"], tuple(item["radius"]))
+    if kind == "blit":
+        return Blit(box, images[item["image"]], tuple(item["radius"]))
+    if kind == "tile":
+        mask = images[item["mask"]] if item["mask"] is not None else None
+        return Tile(box, images[item["image"]], mask)
+    if kind == "text":
+        runs = tuple((tuple(xy), text) for xy, text in item["runs"])
+        font = FontManager.truetype((item["font"]["path"], item["font"]["size"]))
+        return Text(box, runs, item["color"], font)
+    if kind == "clip":
+        return Clip(box, load_op(item["inner"], images))
+    raise ValueError(f"unknown display op: {kind}")
@@ -1,13 +1,16 @@
+from copy import copy
 from dataclasses import dataclass
 from io import BytesIO
-from typing import Dict, List, Optional, Tuple, Type, Union
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
 
 import httpx
 from PIL import Image, ImageDraw
 
+from .display import Blit, Fill, Op, Text
 from .manager import FontManager
-from .operation import radiusMask
+from .text import layout_text
 from .style import *
+from .util import LRUCache
 
 
 @dataclass
@@ -48,6 +51,8 @@ class Rectangle:
                 self.__y = self.top
 
         self.height_read_only = self.height
+        # 行内元素排版后宽度会收缩为子元素宽度之和 子元素重新排版时仍以原宽度为限
+        self.width_read_only = self.width
         self.height = 0.0
 
     @property
@@ -82,7 +87,7 @@ class Rectangle:
         if self.dom.parentNode is None:
             return 0.0
         if self.__x is None:
-            self.__x = self.dom.parentNode.content.x + self.offsetX + self.left
+            self.locate()
         return self.__x
 
     @property
@@ -92,9 +97,34 @@ class Rectangle:
         if self.dom.parentNode is None:
             return 0.0
         if self.__y is None:
-            self.__y = self.dom.parentNode.content.y + self.offsetY + self.top
+            self.locate()
         return self.__y
 
+    def locate(self):
+        """
+        计算并保存绝对坐标
+
+        先向上找到坐标已知的祖先 再自顶向下依次累加偏移 不会递归
+        """
+
+        chain: List[Rectangle] = list()
+        rect = self
+        while rect.dom.parentNode is not None and rect.__x is None:
+            chain.append(rect)
+            rect = rect.dom.parentNode.content
+        for rect in reversed(chain):
+            parent = rect.dom.parentNode.content
+            rect.__x = parent.x + rect.offsetX + rect.left
+            rect.__y = parent.y + rect.offsetY + rect.top
+
+    def relocate(self):
+        "偏移或父节点坐标变化后重新计算绝对坐标"
+
+        if self.dom is None or self.position.equal("absolute"):
+            return
+        self.__x = self.__y = None
+        self.locate()
+
     @property
     def size(self):
         return int(self.width), int(self.finalHeight)
@@ -151,6 +181,53 @@ class Rectangle:
         self.heighten(overlap + child.padding.tiandi + child.finalHeight + child.margin.bottom)
         self.lastMargin = child.margin.bottom
 
+    def grid(self):
+        """
+        网格布局
+
+        列宽在样式中已经算好 这里按顺序逐行放入单元格 行高取该行最高的单元格
+        """
+
+        style = self.dom.style
+        columns = style.gridTemplateColumns
+        widths = columns.value if columns.gridTotal else (self.width,)
+        row_gap, column_gap = style.gridGap.value
+
+        # 每列左侧位置只算一次
+        lefts = list()
+        left = 0.0
+        for width in widths:
+            lefts.append(left)
+            left += width + column_gap
+
+        cells = [child.content for child in self.dom.childNodes if not child.content.position.equal("absolute")]
+        top = 0.0
+        for start in range(0, len(cells), len(lefts)):
+            height = 0.0
+            for left, cell in zip(lefts, cells[start:start + len(lefts)]):
+                cell.set_offset(left + cell.margin.left + cell.padding.left, top + cell.margin.top + cell.padding.top)
+                height = max(height, cell.margin.top + cell.padding.tiandi + cell.finalHeight + cell.margin.bottom)
+            top += height + row_gap
+        if cells:
+            self.heighten(top - row_gap)
+
+
+# 计算样式共享缓存 等价节点直接复用已经计算好的 `Style`
+styleSharing: LRUCache = LRUCache(4096)
+
+# 没有选择器样式层的节点共用
+NO_LAYERS: Tuple[Optional[Style], Optional[Style], Optional[Style]] = (None, None, None)
+
+
+def merge(rules: Tuple[Style, ...]) -> Optional[Style]:
+    "合并同一层的选择器样式 没有规则时返回 None 只有一条时直接共享"
+
+    if len(rules) == 0:
+        return None
+    if len(rules) == 1:
+        return rules[0]
+    return Style().update(*rules)
+
 
 class DOM:
     tagStyle: Style = Style()
@@ -175,12 +252,73 @@ class DOM:
         self.content: Optional[Rectangle] = None
 
         # 样式
+        # tag class id 三层选择器样式只在有规则命中时才创建 没有时为 None
+        # 可能与其他节点共享 通过 `tag_style` 等属性取出时才复制成节点自己的
         self.inner_style = inner_style
-        self.id_style = Style()
-        self.class_style = Style()
-        self.tag_style = Style()
+        self.__layers = NO_LAYERS
+        self.__owned = 0
         self.__ComputedStyle = None
 
+        # 匹配到的 tag class id 三层选择器样式 由模板设置
+        # 不为空时允许与等价的节点共享计算样式
+        self.rules: Optional[Tuple[Tuple[Style, ...], Tuple[Style, ...], Tuple[Style, ...]]] = None
+
+    def match(self, rules: Tuple[Tuple[Style, ...], Tuple[Style, ...], Tuple[Style, ...]]):
+        "设置匹配到的 tag class id 三层选择器样式 同一层有多条时合并"
+
+        self.rules = rules
+        self.__layers = tuple(map(merge, rules))
+        self.__owned = 0
+
+    def __layer(self, index: int) -> Style:
+        """
+        取出一层选择器样式 没有时新建
+
+        外部可能修改它 所以先换成节点自己的副本 并且不再与等价节点共享计算样式
+        """
+
+        if not self.__owned >> index & 1:
+            layer = self.__layers[index]
+            self.__set_layer(index, Style() if layer is None else copy(layer))
+        return self.__layers[index]
+
+    def __set_layer(self, index: int, style: Optional[Style]):
+        layers = list(self.__layers)
+        layers[index] = style
+        self.__layers = tuple(layers)
+        self.__owned |= 1 << index
+        self.rules = None
+
+    @property
+    def tag_style(self) -> Style:
+        "标签选择器样式"
+
+        return self.__layer(0)
+
+    @tag_style.setter
+    def tag_style(self, style: Optional[Style]):
+        self.__set_layer(0, style)
+
+    @property
+    def class_style(self) -> Style:
+        "类选择器样式"
+
+        return self.__layer(1)
+
+    @class_style.setter
+    def class_style(self, style: Optional[Style]):
+        self.__set_layer(1, style)
+
+    @property
+    def id_style(self) -> Style:
+        "id 选择器样式"
+
+        return self.__layer(2)
+
+    @id_style.setter
+    def id_style(self, style: Optional[Style]):
+        self.__set_layer(2, style)
+
     @property
     def tagName(self):
         return self.__class__.__name__.replace("DOM", "").lower()
@@ -198,10 +336,11 @@ class DOM:
         if self.parentNode is None:
             return None
         if self.next_node is None:
+            # 通过 `insert()` 插入的节点已经记录了兄弟 这里只处理直接修改 childNodes 的情况
             childList = self.parentNode.childNodes
-            pos = childList.index(self)
-            if pos == len(childList) - 1:
+            if childList[-1] is self:
                 return None
+            pos = childList.index(self)
             self.next_node = childList[pos + 1]
         return self.next_node
 
@@ -213,9 +352,9 @@ class DOM:
             return None
         if self.previous_node is None:
             childList = self.parentNode.childNodes
-            pos = childList.index(self)
-            if pos == 0:
+            if childList[0] is self:
                 return None
+            pos = childList.index(self)
             self.previous_node = childList[pos - 1]
         return self.previous_node
 
@@ -230,18 +369,63 @@ class DOM:
         """
 
         if self.__ComputedStyle is None:
-            self.__ComputedStyle = self.setComputedStyle()
+            # 祖先的样式可能也还没有计算 先向上找到已经算好的祖先 再自顶向下依次计算 避免深层递归
+            chain: List[DOM] = list()
+            dom = self
+            while dom is not None and dom.__ComputedStyle is None:
+                chain.append(dom)
+                dom = dom.parentNode
+            for dom in reversed(chain):
+                dom.__ComputedStyle = dom.setComputedStyle()
         return self.__ComputedStyle
 
     def setComputedStyle(self) -> Style:
         "计算最终样式"
 
-        return deepcopy(self.tagStyle).update(
-            self.tag_style,
-            self.class_style,
-            self.id_style,
+        parent_style = self.parentNode.style
+        normal_index = self.parentNode.normal_total
+
+        # 标签、选择器样式、行内样式和父节点计算样式都相同的节点 计算样式必然相同
+        # 父节点是 grid 时宽度还取决于所在列
+        key = None
+        if self.rules is not None:
+            column = -1
+            if parent_style.display.equal("grid") and parent_style.gridTemplateColumns.gridTotal:
+                column = normal_index % parent_style.gridTemplateColumns.gridTotal
+            anchors = (parent_style, self.inner_style, *self.rules[0], *self.rules[1], *self.rules[2])
+            key = (self.__class__, column, len(self.rules[0]), len(self.rules[1]), *map(id, anchors))
+            cached = styleSharing.get(key)
+            # 缓存同时持有这些对象 id 不会被复用 这里校验只是以防万一
+            if cached is not None and all(a is b for a, b in zip(cached[0], anchors)):
+                return cached[1]
+
+        # 写时复制 叠加和计算都只替换引用 默认样式和选择器样式中的属性始终共享
+        style = copy(self.tagStyle).update(
+            *self.__layers,
             self.inner_style
-        ).inherit(self.parentNode.style, self.parentNode.normal_total)
+        ).inherit(parent_style, normal_index)
+
+        if key is not None:
+            styleSharing.set(key, (anchors, style))
+        return style
+
+    def box(self) -> Dict[str, Any]:
+        "排版结果 只含可以直接转为 json 的值 不含子节点"
+
+        content = self.content
+        box = {
+            "tag": self.tagName,
+            "x": content.x,
+            "y": content.y,
+            "width": content.width,
+            "height": content.finalHeight,
+            "margin": list(content.margin.value),
+            "padding": list(content.padding.value),
+        }
+        for key in ("id", "class"):
+            if isinstance(self.attributes.get(key), str):
+                box[key] = self.attributes[key]
+        return box
 
     def __repr__(self):
         attr_text = ""
@@ -265,6 +449,11 @@ class DOM:
         if node is None:
             return
         node.parentNode = self
+        # 插入时记录兄弟节点 之后访问兄弟是常数时间
+        if self.childNodes:
+            last = self.childNodes[-1]
+            last.next_node = node
+            node.previous_node = last
         self.childNodes.append(node)
 
     def insert_true_node(self, latest_node: Optional["DOM"] = None):
@@ -302,19 +491,28 @@ class DOM:
         self.insert_true_node()
 
         if isinstance(child, str):
-            self.childNodes.append(TextDOM(self, child))
+            self.insert(TextDOM(self, child))
         elif isinstance(child, DOM):
             self.insert(child)
 
-    def paste(self, canvas: Image.Image, draw: ImageDraw.ImageDraw):
-        "将内容粘贴在画布上"
+    def display(self, draw: ImageDraw.ImageDraw) -> List[Op]:
+        "绘制指令 即背景"
 
-        # 背景颜色
         background = self.content.background
-        bg = Image.new("RGBA", background.size, self.style.backgroundColor.value)
-        # 虽然 borderRadius 已经是 8 值属性了 但是 radiusMask 目前只支持四个参数 问就是我懒
-        a = radiusMask(bg.getchannel("A"), self.style.borderRadius.value[:4])
-        canvas.paste(bg, background.xy, mask=a)
+        left, top = background.xy
+        width, height = background.size
+        style = self.style
+        return [Fill((left, top, left + width, top + height), style.backgroundColor.value, tuple(style.borderRadius.value[:4]))]
+
+    def paste(self, canvas: Image.Image, draw: ImageDraw.ImageDraw, origin: Tuple[int, int] = (0, 0)):
+        """
+        将内容粘贴在画布上
+
+        origin: 画布左上角对应的绝对坐标 局部重绘时画布只是一块切片
+        """
+
+        for op in self.display(draw):
+            op.replay(canvas, draw, origin)
 
 
 class ImgDOM(DOM):
@@ -323,11 +521,17 @@ class ImgDOM(DOM):
     def resize(self, width: int, height: Optional[int] = None):
         "缩放图片"
 
-        height = int(height) if height is not None else int(width * self.img.height / self.img.width)
-        width = int(width)
+        width, height = self.scaled_size(self.img.size, width, height)
         if self.img.width != width or self.img.height != height:
             self.img = self.img.resize((width, height), Image.LANCZOS).convert("RGBA")
 
+    @staticmethod
+    def scaled_size(size: Tuple[int, int], width: float, height: Optional[float] = None) -> Tuple[int, int]:
+        "缩放后的尺寸 未指定高度时按原图比例计算"
+
+        height = int(height) if height is not None else int(width * size[1] / size[0])
+        return int(width), height
+
     def fetch_image(self):
         "获取图片"
 
@@ -342,17 +546,45 @@ class ImgDOM(DOM):
         self.img = img
 
         self.resize(*self.style.values("width", "height"))
+        self.set_content(self.img.width, self.img.height)
+
+    def measure_image(self, sizes: Optional[Dict[str, Tuple[int, int]]] = None):
+        """
+        只计算尺寸 不下载、不缩放图片
+
+        sizes: 图片地址到原始尺寸的提示 指定了高度或者 src 本身就是图片时不需要
+
+        无法得知原始尺寸时仍然会下载图片
+        """
+
+        width, height = self.style.values("width", "height")
+        src = self.attributes.get("src")
+        if height is not None:
+            size = (1, 1)  # 长宽都已指定 与原图无关
+        elif isinstance(src, Image.Image):
+            size = src.size
+        elif sizes is not None and src in sizes:
+            size = sizes[src]
+        else:
+            return self.fetch_image()
+
+        self.img = None
+        self.set_content(*self.scaled_size(size, width, height))
+
+    def set_content(self, width: int, height: int):
+        "生成图片矩形"
+
         self.content = Rectangle(
             dom=self,
             top=self.style.top.value,
             left=self.style.left.value,
-            width=self.img.width,
-            height=self.img.height
+            width=width,
+            height=height
         )
 
-    def paste(self, canvas: Image.Image, _: ImageDraw.ImageDraw):
-        a = radiusMask(self.img.getchannel("A"), self.style.borderRadius.value[:4])
-        canvas.paste(self.img, self.content.xy, a)
+    def display(self, draw: ImageDraw.ImageDraw) -> List[Op]:
+        left, top = self.content.xy
+        return [Blit((left, top, left + self.img.width, top + self.img.height), self.img, tuple(self.style.borderRadius.value[:4]))]
 
 
 class TextDOM(DOM):
@@ -363,14 +595,19 @@ class TextDOM(DOM):
     def __init__(self, parentNode: DOM, text: str = ""):
         super().__init__()
         self.text = text
+        # 断行后每行在原文中的 (起点, 终点)
+        self.lines: List[Tuple[int, int]] = list()
+        # 上次测量的 ((位置, 文字, 字体), 绘制区域)
+        self.bbox: Optional[Tuple[Tuple, Tuple[int, int, int, int]]] = None
         self.parentNode = parentNode
+        self.rules = (tuple(), tuple(), tuple())
 
     def set_size(self):
         "根据最大限制宽度切割文本"
 
         # 获取书写区域、字体
         bro = self.previousSibling
-        first_width = max_width = self.parentNode.content.width
+        first_width = max_width = self.parentNode.content.width_read_only
         self.font = FontManager.from_style(self.parentNode.style)
 
         # display: inline 和 float: left 等属性出现会使得
@@ -389,38 +626,21 @@ class TextDOM(DOM):
             # 吗的不写了
             
 
-        # 分割文本
-        sentences = []
-        self.height = 0.0
-
-        def getHeight(temp: str):
-            sentences.append(temp)
-            _, offset, _, h = self.font.getbbox(temp)
-            return offset / 2 + h
-
-        def split(text: str, max_width: float):
-            temp = ""
-            for chn in text:
-                if self.font.getlength(temp + chn) > max_width:
-                    return temp
-                temp += chn
-            return temp
-
-        tt = self.text
-        while len(tt):
-            temp = split(tt, max_width)
-            self.height += getHeight(temp)
-            tt = tt.replace(temp, "", 1)
-
-        self.text = "\n".join(sentences)
+        # 分割文本 相同字体、文字和宽度的排版结果在进程内共享
+        layout = layout_text(FontManager.metrics(self.font), self.text, max_width)
+        self.lines = list(layout.lines)
+        self.text = "\n".join(self.text[start:end] for start, end in layout.lines)
 
         # 修正尺寸
-        if len(sentences) == 1:
-            self.width = self.font.getlength(self.text)
-        else:
-            self.width = max_width
+        self.width = layout.width
+        self.height = layout.height
         self.content = Rectangle(dom=self, width=self.width, height=self.height)
 
+    def box(self) -> Dict[str, Any]:
+        box = super().box()
+        box["text"] = self.text
+        return box
+
     @property
     def size(self):
         "获取大小"
@@ -430,21 +650,40 @@ class TextDOM(DOM):
     def __repr__(self):
         return self.text
 
-    def paste(self, _: Image.Image, draw: ImageDraw.ImageDraw):
-        left, top = self.content.xy
+    def display(self, draw: ImageDraw.ImageDraw) -> List[Op]:
+        xy = self.content.xy
         # if self.parentNode.style.float.equal("right"):
         #     left += self.max_width - self.width
-        draw.text((left, top), self.text, self.parentNode.style.color.value, self.font)
+        # 测量字形边界比较慢 位置、文字和字体都没变时沿用上次的结果
+        if self.bbox is None or self.bbox[0] != (xy, self.text, self.font):
+            # 抗锯齿可能超出字形边界 向外多留一像素
+            left, top, right, bottom = draw.textbbox(xy, self.text, self.font)
+            self.bbox = (xy, self.text, self.font), (left - 1, top - 1, right + 1, bottom + 1)
+        return [Text(self.bbox[1], ((xy, self.text),), self.parentNode.style.color.value, self.font)]
+
+
+# 根节点的计算样式 以行内样式的 id 和算好的字号为键
+# 同一模板每次渲染得到同一个对象 子孙才能跨渲染命中 `styleSharing`
+rootStyles: LRUCache = LRUCache(256)
 
 
 class BodyDOM(DOM):
     def setComputedStyle(self) -> Style:
-        self.inner_style.fontSize.transform(16)
-        self.inner_style.width.transform(self.inner_style.fontSize.value)
-        for _, attr in self.inner_style.attributs:
+        fontSize = self.inner_style.fontSize.resolve(16)
+        key = (id(self.inner_style), fontSize.value)
+        cached = rootStyles.get(key)
+        # 缓存同时持有行内样式 id 不会被复用
+        if cached is not None and cached[0] is self.inner_style:
+            return cached[1]
+
+        style = copy(self.inner_style)
+        style.fontSize = fontSize
+        style.width = style.width.resolve(style.fontSize.value)
+        for name, attr in style.attributs:
             if attr.unset:
-                attr.init().transform(*self.inner_style.values(*attr.compared))
-        return self.inner_style
+                style[name] = copy(attr).init().resolve(*style.values(*attr.compared))
+        rootStyles.set(key, (self.inner_style, style))
+        return style
 
 
 class TemplateDOM(BodyDOM): ...
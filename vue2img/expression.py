@@ -0,0 +1,147 @@
+import operator
+import re
+from typing import Callable, List, Tuple, Union
+
+from .util import LRUCache
+
+# 长度表达式编译器
+# 把 `1.5em` `calc(100% - 2em)` 这类表达式编译成以 (font_size, compared_value) 为参数的函数
+# 只支持 + - * / 括号和 px em % 三种单位 不再需要 eval
+
+Number = Union[int, float]
+Length = Callable[[float, float], Number]
+
+tokenPattern = re.compile(r"\s*(?:(\d*\.?\d+(?:[eE][-+]?\d+)?)(px|em|%)?|(calc)|([-+*/()]))")
+
+OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+class ExpressionError(Exception): ...
+
+
+def tokenize(expr: str) -> List[Tuple[str, str]]:
+    "分词 返回 (类型, 值) 类型有 num em % op"
+
+    tokens: List[Tuple[str, str]] = list()
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = tokenPattern.match(expr, pos)
+        if m is None or m.end() == pos:
+            raise ExpressionError(f"无法识别 {expr[pos:]!r}")
+        number, unit, calc, op = m.groups()
+        if number is not None:
+            tokens.append((unit if unit in ("em", "%") else "num", number))
+        elif op is not None:
+            tokens.append(("op", op))
+        # calc 只是括号前的修饰 直接忽略
+        pos = m.end()
+    return tokens
+
+
+class Parser:
+    """
+    递归下降
+
+    每个节点编译为 (常量, 函数) 常量不为 None 时说明与参数无关 可以直接折叠
+    """
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None, None
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise ExpressionError(f"多余的 {self.peek()[1]!r}")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            node = binary(OPERATORS[self.take()[1]], node, self.term())
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.peek() in (("op", "*"), ("op", "/")):
+            node = binary(OPERATORS[self.take()[1]], node, self.factor())
+        return node
+
+    def factor(self):
+        kind, value = self.take()
+        if kind == "num":
+            # 与 eval 相同 没有小数点的数字是整数
+            number = float(value) if "." in value or "e" in value.lower() else int(value)
+            return number, None
+        if kind == "em":
+            number = float(value)
+            return None, lambda font_size, compared_value: number * font_size
+        if kind == "%":
+            number = float(value)
+            return None, lambda font_size, compared_value: number * compared_value / 100
+        if (kind, value) == ("op", "-"):
+            const, func = self.factor()
+            if const is not None:
+                return -const, None
+            return None, lambda font_size, compared_value: -func(font_size, compared_value)
+        if (kind, value) == ("op", "+"):
+            return self.factor()
+        if (kind, value) == ("op", "("):
+            node = self.expr()
+            if self.take() != ("op", ")"):
+                raise ExpressionError("括号没有闭合")
+            return node
+        raise ExpressionError("表达式不完整" if kind is None else f"意外的 {value!r}")
+
+
+def binary(op: Callable, left, right):
+    "编译二元运算 两侧都是常量时直接算出结果"
+
+    lc, lf = left
+    rc, rf = right
+    if lc is not None and rc is not None:
+        return op(lc, rc), None
+    if lc is not None:
+        return None, lambda font_size, compared_value: op(lc, rf(font_size, compared_value))
+    if rc is not None:
+        return None, lambda font_size, compared_value: op(lf(font_size, compared_value), rc)
+    return None, lambda font_size, compared_value: op(lf(font_size, compared_value), rf(font_size, compared_value))
+
+
+# 编译好的长度表达式 以表达式原文为键 调用 `lengthCache.info()` 查看命中率
+lengthCache: LRUCache = LRUCache(4096)
+
+
+def compile_length(expr: str) -> Length:
+    """
+    ### 编译长度表达式
+
+    结果按表达式缓存在 `lengthCache` 里 返回 `func(font_size, compared_value)`
+    """
+
+    func = lengthCache.get(expr)
+    if func is not None:
+        return func
+    try:
+        const, func = Parser(tokenize(expr)).parse()
+    except ExpressionError as e:
+        raise ExpressionError(f"{e}: 你传的 {expr} 是牛魔啊")
+    if const is not None:
+        func = lambda font_size, compared_value: const
+    return lengthCache.set(expr, func)
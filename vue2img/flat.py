@@ -0,0 +1,113 @@
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .dom import DOM
+from .util import iter_preorder
+
+
+class FlatTree:
+    """
+    ### 扁平树
+
+    排版完成后把 `DOM` 树按前序展开成若干平行数组 节点 `i` 的子树是 `[i, i + size[i])`
+
+    parent, firstChild, nextSibling: 节点序号 不存在时为 -1
+
+    size: 子树节点数 含自身
+
+    depth: 深度
+
+    x, y, width, height: 内容区矩形
+
+    margin, padding: 上右下左四个值 形状为 (n, 4)
+
+    数组只是排版结果的快照 `DOM` 仍是唯一的数据来源 通过 `nodes[i]` 访问
+    """
+
+    def __init__(self, root: DOM):
+        self.nodes: List[DOM] = [dom for dom, _, _ in iter_preorder(root)]
+        self.indexes: Dict[DOM, int] = {dom: i for i, dom in enumerate(self.nodes)}
+
+        n = len(self.nodes)
+        self.parent = np.full(n, -1, dtype=np.int64)
+        self.firstChild = np.full(n, -1, dtype=np.int64)
+        self.nextSibling = np.full(n, -1, dtype=np.int64)
+        self.size = np.ones(n, dtype=np.int64)
+        self.depth = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.width = np.zeros(n)
+        self.height = np.zeros(n)
+        self.margin = np.zeros((n, 4))
+        self.padding = np.zeros((n, 4))
+
+        last: Dict[int, int] = dict()  # 每个节点目前最后一个子节点
+        for i, dom in enumerate(self.nodes):
+            content = dom.content
+            self.x[i] = content.x
+            self.y[i] = content.y
+            self.width[i] = content.width
+            self.height[i] = content.finalHeight
+            self.margin[i] = content.margin.value
+            self.padding[i] = content.padding.value
+
+            if dom.parentNode is None:
+                continue
+            p = self.indexes[dom.parentNode]
+            self.parent[i] = p
+            self.depth[i] = self.depth[p] + 1
+            if p in last:
+                self.nextSibling[last[p]] = i
+            else:
+                self.firstChild[p] = i
+            last[p] = i
+
+        # 前序中子节点都在父节点之后 倒序累加就是子树大小
+        for i in range(n - 1, 0, -1):
+            self.size[self.parent[i]] += self.size[i]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def index(self, dom: DOM) -> int:
+        "节点序号"
+
+        return self.indexes[dom]
+
+    def children(self, i: int) -> Iterator[int]:
+        "子节点序号"
+
+        child = self.firstChild[i]
+        while child != -1:
+            yield int(child)
+            child = self.nextSibling[child]
+
+    def subtree(self, i: int) -> range:
+        "子树中所有节点的序号"
+
+        return range(i, i + int(self.size[i]))
+
+    @property
+    def boxes(self) -> np.ndarray:
+        "背景矩形 (left, top, right, bottom) 与 `Rectangle.background` 一致 含 padding"
+
+        top, right, bottom, left = self.padding.T
+        return np.stack((self.x - left, self.y - top, self.x + self.width + right, self.y + self.height + bottom), axis=1)
+
+    def paint_order(self) -> np.ndarray:
+        "绘制顺序 与 `createApp.export()` 的广度优先顺序相同 即同一深度内保持前序"
+
+        return np.argsort(self.depth, kind="stable")
+
+    def hit(self, x: float, y: float) -> Optional[DOM]:
+        "命中测试 返回包含该点且最后绘制的节点"
+
+        boxes = self.boxes
+        mask = (boxes[:, 0] <= x) & (x < boxes[:, 2]) & (boxes[:, 1] <= y) & (y < boxes[:, 3])
+        hits = np.flatnonzero(mask)
+        if len(hits) == 0:
+            return None
+        rank = np.empty(len(self.nodes), dtype=np.int64)
+        rank[self.paint_order()] = np.arange(len(self.nodes))
+        return self.nodes[hits[np.argmax(rank[hits])]]
@@ -1,14 +1,93 @@
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 
 from PIL import ImageFont
 
 from .style import Style
+from .text import break_lines, break_lines_by_step
+
+
+class FontMetrics:
+    """
+    ### 字体度量缓存
+
+    按字符缓存宽度和上下边界 按字符对缓存字距调整
+
+    BASIC 排版下一段文字的宽度等于各字符宽度加相邻字符对的字距 上下边界是各字符边界的最值 与直接测量结果完全相同
+
+    raqm 排版会对整段文字塑形 这时退回直接测量
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        self.ascent, self.descent = font.getmetrics()
+        self.basic = font.layout_engine == ImageFont.Layout.BASIC
+        self.advances: Dict[str, float] = dict()
+        self.kernings: Dict[str, float] = dict()
+        self.extents: Dict[str, Tuple[int, int]] = dict()
+
+    def advance(self, chn: str) -> float:
+        "单个字符的宽度"
+
+        adv = self.advances.get(chn)
+        if adv is None:
+            adv = self.advances[chn] = self.font.getlength(chn)
+        return adv
+
+    def step(self, prev: str, chn: str) -> float:
+        "在 prev 后追加 chn 增加的宽度 prev 为空说明是行首"
+
+        adv = self.advance(chn)
+        if prev == "":
+            return adv
+        pair = prev + chn
+        kern = self.kernings.get(pair)
+        if kern is None:
+            kern = self.kernings[pair] = self.font.getlength(pair) - self.advance(prev) - adv
+        return adv + kern
+
+    def getlength(self, text: str) -> float:
+        "文字宽度"
+
+        if not self.basic:
+            return self.font.getlength(text)
+        width = 0.0
+        prev = ""
+        for chn in text:
+            width += self.step(prev, chn)
+            prev = chn
+        return width
+
+    def extent(self, chn: str) -> Tuple[int, int]:
+        "单个字符在 `getbbox()` 中的上下边界"
+
+        ext = self.extents.get(chn)
+        if ext is None:
+            _, top, _, bottom = self.font.getbbox(chn)
+            ext = self.extents[chn] = (top, bottom)
+        return ext
+
+    def getextent(self, text: str) -> Tuple[int, int]:
+        "文字的上下边界 与 `getbbox()` 的第二、四个值相同"
+
+        if not self.basic or text == "":
+            _, top, _, bottom = self.font.getbbox(text)
+            return top, bottom
+        extents = [self.extent(chn) for chn in set(text)]
+        return min(top for top, _ in extents), max(bottom for _, bottom in extents)
+
+    def break_lines(self, text: str, max_width: float) -> List[Tuple[int, int]]:
+        "按最大宽度断行 返回每行在原文中的 (起点, 终点)"
+
+        if not self.basic:
+            return break_lines(text, self.font.getlength, max_width)
+        return break_lines_by_step(text, self.step, max_width)
 
 
 class FontManager:
     "字体管理器"
 
     __fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = dict()
+    __metrics: Dict[ImageFont.FreeTypeFont, FontMetrics] = dict()
 
     @classmethod
     def truetype(cls, key: Tuple[str, int]):
@@ -28,4 +107,12 @@ class FontManager:
     def from_style(cls, style: Style):
         "从样式获取字体"
 
-        return cls.truetype(style.values("fontFamily", "fontSize"))
\ No newline at end of file
+        return cls.truetype(style.values("fontFamily", "fontSize"))
+
+    @classmethod
+    def metrics(cls, font: ImageFont.FreeTypeFont) -> FontMetrics:
+        "获取字体的度量缓存 与字体一样不会被释放"
+
+        if font not in cls.__metrics:
+            cls.__metrics[font] = FontMetrics(font)
+        return cls.__metrics[font]
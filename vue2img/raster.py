@@ -0,0 +1,231 @@
+import math
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .display import Box, DisplayList, Fill, Op, Tile, intersect
+from .dom import DOM
+from .operation import radiusMask
+from .util import LRUCache, iter_preorder
+
+# 子树位图缓存 以子树指纹为键 进程内跨渲染共享
+# 按像素数限制总大小 调用 `rasterCache.info()` 查看命中率 `rasterCache.resize()` 调整上限
+rasterCache: LRUCache = LRUCache(256, weigh=lambda value: value[0].width * value[0].height, maxweight=16_000_000)
+
+# 见过但还没有画成位图的子树指纹 同一指纹第二次出现时才画成位图 值为 None
+# 指纹中的图片以内容摘要代替 键不持有图片 两个缓存的大小都只取决于条目数和位图像素
+rasterSeen: LRUCache = LRUCache(4096)
+
+# 没有指令的节点 与任何矩形都不相交 取外接矩形时不影响结果
+EMPTY: Box = (2 ** 62, 2 ** 62, -2 ** 62, -2 ** 62)
+
+
+def corners(box: Box, radius: Tuple[float, ...]) -> List[Box]:
+    "圆角所在的方块 圆角遮罩只会改动这些方块"
+
+    left, top, right, bottom = box
+    r = [math.ceil(v) for v in radius]
+    squares = [
+        (left, top, left + r[0], top + r[0]),
+        (right - r[1], top, right, top + r[1]),
+        (right - r[2], bottom - r[2], right, bottom),
+        (left, bottom - r[3], left + r[3], bottom),
+    ]
+    return [square for square, v in zip(squares, r) if v]
+
+
+def overlaps(boxes: np.ndarray, targets: List[Box]) -> bool:
+    "boxes 中是否有矩形与 targets 中任一矩形相交"
+
+    if len(boxes) == 0 or len(targets) == 0:
+        return False
+    a = boxes[:, None, :]
+    b = np.array(targets, dtype=np.int64)[None, :, :]
+    return bool(np.any((a[..., 0] < b[..., 2]) & (b[..., 0] < a[..., 2]) & (a[..., 1] < b[..., 3]) & (b[..., 1] < a[..., 3])))
+
+
+class Rasterizer:
+    """
+    ### 子树位图
+
+    为一份剔除后的显示列表找出可以整体缓存的子树 把它们换成一条 `Tile` 指令
+
+    前序序号、子树范围等只在创建时计算一次 每个子树在前序排列的指令中是连续的一段
+
+    子树以其中每条指令相对根的位置为指纹 相同指纹的子树不论在哪次渲染、画在哪里都共用一张位图
+
+    指纹第一次出现时照常逐条绘制 只记下指纹 再次出现才画成位图 没有重复的页面不会多花时间生成位图
+    """
+
+    def __init__(self, root: DOM, display: DisplayList, nesting: int = 3):
+        self.display = display
+        self.nesting = nesting
+        # 命中缓存或第二次出现的指纹数 为 0 说明这次没有可以复用的子树
+        self.repeated = 0
+
+        nodes = [dom for dom, _, _ in iter_preorder(root)]
+        self.nodes = nodes
+        self.index = {dom: i for i, dom in enumerate(nodes)}
+        self.parent = [self.index[dom.parentNode] if i else -1 for i, dom in enumerate(nodes)]
+
+        # 每条指令来自的节点序号 按前序序号稳定排序后 节点 i 的指令位于 order[bounds[i]:bounds[i + 1]]
+        self.owner = np.array([self.index[dom] for dom in display.owners], dtype=np.int64)
+        self.boxes = np.array([op.box for op in display.ops], dtype=np.int64).reshape(-1, 4)
+        self.order = np.argsort(self.owner, kind="stable")
+        self.bounds = np.searchsorted(self.owner[self.order], np.arange(len(nodes) + 1)).tolist()
+        self.sorted_boxes = self.boxes[self.order]
+
+        # 每个节点的第一条指令、在绘制顺序中的位置 以及子树大小、子树内指令的外接矩形、子孙指令的外接矩形、最后一条指令的位置
+        n = len(nodes)
+        first: List[Optional[Op]] = [None] * n
+        start = [len(display)] * n
+        last = [-1] * n
+        union = [EMPTY] * n
+        inner = [EMPTY] * n
+        size = [1] * n
+        for k, (op, i) in enumerate(zip(display.ops, self.owner.tolist())):
+            if first[i] is None:
+                first[i], start[i] = op, k
+            last[i] = k
+            a, b = union[i], op.box
+            union[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+        for i in range(n - 1, 0, -1):
+            p = self.parent[i]
+            size[p] += size[i]
+            a, b = union[p], union[i]
+            union[p] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+            a = inner[p]
+            inner[p] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+            last[p] = max(last[p], last[i])
+        self.first, self.start, self.last, self.union, self.inner, self.size = first, start, last, union, inner, size
+
+        self.candidates = self.memoizable()
+        # 超出缓存上限的子树存不下 画进位图再贴上反而更慢 照常逐条绘制
+        self.roots: Set[DOM] = set()
+        for dom in self.candidates:
+            left, top, right, bottom = self.first[self.index[dom]].box
+            if rasterCache.maxweight is None or (right - left) * (bottom - top) <= rasterCache.maxweight:
+                self.roots.add(dom)
+
+    def memoizable(self) -> List[DOM]:
+        "找出可以整体缓存的子树 条件见 `memoizable()`"
+
+        first, start, last, union, inner, size, parent = self.first, self.start, self.last, self.union, self.inner, self.size, self.parent
+        bounds = self.bounds
+        roots: List[DOM] = list()
+        level = [0] * len(self.nodes)  # 包括自身在内有几个祖先是子树根
+        for i, dom in enumerate(self.nodes):
+            if i:
+                level[i] = level[parent[i]]
+            op = first[i]
+            if level[i] >= self.nesting or not isinstance(op, Fill) or last[i] == start[i] or union[i] != op.box or not op.opaque:
+                continue
+            end = i + size[i]
+            # 子孙的外接矩形碰到圆角时再逐条检查 子孙的指令在前序排列中紧跟着根自己的指令
+            squares = [square for square in corners(op.box, op.radius) if intersect(square, inner[i])]
+            if squares and overlaps(self.sorted_boxes[bounds[i + 1]:bounds[end]], squares):
+                continue
+            # 子树的指令在绘制顺序中连续时 中间没有其他指令
+            if last[i] - start[i] + 1 != bounds[end] - bounds[i]:
+                between = slice(start[i] + 1, last[i] + 1)
+                owner = self.owner[between]
+                if overlaps(self.boxes[between][(owner < i) | (owner >= end)], [op.box]):
+                    continue
+            level[i] += 1
+            roots.append(dom)
+        return roots
+
+    def subtree(self, dom: DOM) -> List[int]:
+        "子树中的指令在显示列表中的位置 按绘制顺序排列"
+
+        i = self.index[dom]
+        return sorted(self.order[self.bounds[i]:self.bounds[i + self.size[i]]].tolist())
+
+    def memoize(self) -> DisplayList:
+        "把可以整体缓存的子树换成 `Tile` 指令 没有可以复用的子树时原样返回"
+
+        if not self.roots:
+            return self.display
+        ops = self.collapse(list(range(len(self.display))))
+        if len(ops) == len(self.display):
+            return self.display
+        return DisplayList(ops)
+
+    def collapse(self, positions: List[int]) -> List[Op]:
+        "按绘制顺序排列的指令 其中可以缓存的子树换成 `Tile`"
+
+        display = self.display
+        result: List[Op] = list()
+        done: Set[DOM] = set()
+        for k in positions:
+            dom = display.owners[k]
+            if dom in done:
+                continue
+            if dom in self.roots:
+                picked = self.subtree(dom)
+                tile = self.rasterize(picked)
+                if tile is not None:
+                    done.update(display.owners[j] for j in picked)
+                    result.append(tile)
+                    continue
+            result.append(display.ops[k])
+        return result
+
+    def rasterize(self, picked: List[int]) -> Optional[Tile]:
+        "子树位图 指纹第一次出现时返回 None"
+
+        background: Fill = self.display.ops[picked[0]]
+        left, top, right, bottom = background.box
+        key = tuple(self.display.ops[j].fingerprint(-left, -top) for j in picked)
+        cached = rasterCache.get(key)
+        if cached is None:
+            if key not in rasterSeen:
+                rasterSeen.set(key, None)
+                return None
+            self.repeated += 1
+            tile = Image.new("RGBA", (right - left, bottom - top), background.color)
+            mask = None
+            if any(background.radius):
+                mask = radiusMask(Image.new("L", tile.size, 255), background.radius)
+            draw = ImageDraw.Draw(tile)
+            # 子树内部可以缓存的部分同样直接贴上
+            for op in self.collapse(picked[1:]):
+                op.replay(tile, draw, (left, top))
+            cached = rasterCache.set(key, (tile, mask))
+        else:
+            self.repeated += 1
+        return Tile(background.box, cached[0], cached[1])
+
+    def paint(self, canvas: Image.Image, draw: Optional[ImageDraw.ImageDraw] = None, origin: Tuple[int, int] = (0, 0)) -> int:
+        "按顺序绘制 可以整体缓存的子树一次贴上 返回重放的指令数"
+
+        return self.memoize().merge_text().replay(canvas, draw, origin)
+
+
+def memoizable(root: DOM, display: DisplayList, nesting: int = 3) -> List[DOM]:
+    """
+    ### 找出可以整体缓存的子树
+
+    display: 剔除空指令后的显示列表 指令需要带着来源节点
+
+    nesting: 最多嵌套几层 嵌套的子树会递归生成位图 层数过多时既慢又可能超出递归深度
+
+    返回子树根节点 可能互相嵌套 满足
+
+    1. 根的第一条指令是完全不透明的背景
+
+    2. 子孙的指令都在根的背景矩形内 并且不碰到圆角
+
+    3. 在根与最后一个子孙之间绘制的其他指令不与根相交
+
+    这样先在根的背景色上画好子孙 再按圆角遮罩贴到画布上 与逐条指令直接绘制的结果相同
+    """
+
+    return Rasterizer(root, display, nesting).candidates
+
+
+def memoize(root: DOM, display: DisplayList) -> DisplayList:
+    "把可以整体缓存的子树换成一条 `Tile` 指令 见 `Rasterizer`"
+
+    return Rasterizer(root, display).memoize()
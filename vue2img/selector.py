@@ -0,0 +1,230 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, Union
+
+from lxml.cssselect import CSSSelector
+from lxml.etree import Element as ElementTag
+from lxml.etree import _Element as Element
+
+from .style import Style
+from .util import LRUCache
+
+compoundPattern = re.compile(r"^(\*|[A-Za-z][\w-]*)?((?:[#.][\w-]+)*)$")
+simplePattern = re.compile(r"[#.][\w-]+")
+
+
+def selector_layer(selector: str) -> int:
+    """
+    选择器所属样式层 0: tag 1: class 2: id
+
+    只看最右侧的部分 与 `DOM.tag_style` `DOM.class_style` `DOM.id_style` 对应
+    """
+
+    query = selector.strip().split(" ")[-1]
+    if query.startswith("#"):
+        return 2
+    elif query.startswith("."):
+        return 1
+    return 0
+
+
+@dataclass(frozen=True)
+class Compound:
+    "复合选择器 例如 `p.title#main`"
+
+    tag: Optional[str] = None
+    id: Optional[str] = None
+    classes: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def parse(cls, token: str) -> Optional["Compound"]:
+        "解析 不支持时返回 None"
+
+        m = compoundPattern.match(token)
+        if m is None or token == "":
+            return None
+        tag, rest = m.groups()
+        ids = [s[1:] for s in simplePattern.findall(rest) if s[0] == "#"]
+        if len(ids) > 1:
+            return None
+        classes = frozenset(s[1:] for s in simplePattern.findall(rest) if s[0] == ".")
+        return cls(None if tag == "*" else tag, ids[0] if ids else None, classes)
+
+    def match(self, ele: Element) -> bool:
+        if self.tag is not None and ele.tag != self.tag:
+            return False
+        if self.id is not None and ele.get("id") != self.id:
+            return False
+        if self.classes:
+            names = ele.get("class")
+            if names is None or not self.classes.issubset(names.split()):
+                return False
+        return True
+
+
+@dataclass(frozen=True)
+class Selector:
+    """
+    由后代 ` ` 和子元素 `>` 组合的选择器
+
+    compounds: 从左到右的复合选择器
+
+    combinators: 相邻复合选择器间的组合符
+    """
+
+    text: str
+    compounds: Tuple[Compound, ...]
+    combinators: Tuple[str, ...]
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["Selector"]:
+        "解析 出现伪类、属性、兄弟组合符等暂不支持的写法时返回 None"
+
+        compounds: List[Compound] = list()
+        combinators: List[str] = list()
+        combinator = None
+        for token in text.replace(">", " > ").split():
+            if token == ">":
+                if combinator is not None or not compounds:
+                    return None
+                combinator = ">"
+                continue
+            compound = Compound.parse(token)
+            if compound is None:
+                return None
+            if compounds:
+                combinators.append(combinator or " ")
+            compounds.append(compound)
+            combinator = None
+        if not compounds or combinator is not None:
+            return None
+        return cls(text, tuple(compounds), tuple(combinators))
+
+    @property
+    def key(self) -> Compound:
+        "最右侧复合选择器 用于索引"
+
+        return self.compounds[-1]
+
+    def match(self, ele: Element, root: Element) -> bool:
+        "从右向左匹配 祖先不会超出 root"
+
+        return self.__match(ele, len(self.compounds) - 1, root)
+
+    def __match(self, ele: Element, i: int, root: Element) -> bool:
+        if not self.compounds[i].match(ele):
+            return False
+        if i == 0:
+            return True
+        if ele is root:
+            return False
+        parent = ele.getparent()
+        if self.combinators[i - 1] == ">":
+            return parent is not None and self.__match(parent, i - 1, root)
+        while parent is not None:
+            if self.__match(parent, i - 1, root):
+                return True
+            if parent is root:
+                break
+            parent = parent.getparent()
+        return False
+
+
+# 进程内共享的选择器缓存 以选择器文本为键
+selector_cache: LRUCache = LRUCache(1024)
+
+
+def compile_selector(text: str) -> Union[Selector, CSSSelector]:
+    "解析选择器 不支持的写法编译为 XPath 结果会被缓存"
+
+    def factory():
+        selector = Selector.parse(text)
+        return selector if selector is not None else CSSSelector(text)
+    return selector_cache.fetch(text, factory)
+
+
+class RuleIndex:
+    """
+    ### 规则索引
+
+    与浏览器类似 按最右侧的 id class tag 把规则分桶
+
+    匹配时每个元素只检查可能命中的规则
+
+    无法解析的选择器退回 cssselect 先整体查询一次
+
+    每条选择器记录 (选择器序号, 规则序号, 层, 选择器, 样式) 声明块相同的规则共用同一个 `Style` 去重时按规则序号区分
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.rules = 0
+        self.ids: Dict[str, List[Tuple[int, int, int, Selector, Style]]] = dict()
+        self.classes: Dict[str, List[Tuple[int, int, int, Selector, Style]]] = dict()
+        self.tags: Dict[str, List[Tuple[int, int, int, Selector, Style]]] = dict()
+        self.universal: List[Tuple[int, int, int, Selector, Style]] = list()
+        self.fallback: List[Tuple[int, int, int, CSSSelector, Style]] = list()
+
+    def add(self, selectors: str, rule: Style):
+        "添加规则 逗号分隔的选择器会拆开分别索引"
+
+        number = self.rules
+        self.rules += 1
+        for text in selectors.split(","):
+            text = text.strip()
+            if text == "":
+                continue
+            order = self.count
+            self.count += 1
+            layer = selector_layer(text)
+            selector = compile_selector(text)
+            if isinstance(selector, CSSSelector):
+                self.fallback.append((order, number, layer, selector, rule))
+                continue
+            key = selector.key
+            if key.id is not None:
+                bucket = self.ids.setdefault(key.id, [])
+            elif key.classes:
+                bucket = self.classes.setdefault(min(key.classes), [])
+            elif key.tag is not None:
+                bucket = self.tags.setdefault(key.tag, [])
+            else:
+                bucket = self.universal
+            bucket.append((order, number, layer, selector, rule))
+
+    def candidates(self, ele: Element):
+        "元素可能命中的规则"
+
+        eid = ele.get("id")
+        if eid is not None:
+            yield from self.ids.get(eid, [])
+        names = ele.get("class")
+        if names is not None:
+            for name in set(names.split()):
+                yield from self.classes.get(name, [])
+        yield from self.tags.get(ele.tag, [])
+        yield from self.universal
+
+    def match(self, root: Element) -> Dict[Element, Tuple[List[Style], List[Style], List[Style]]]:
+        "一次遍历 返回每个元素的 tag class id 三层样式 层内按样式表顺序排列"
+
+        fallback: List[Tuple[int, int, int, Set[Element], Style]] = [
+            (order, number, layer, set(xpath(root)), rule) for order, number, layer, xpath, rule in self.fallback
+        ]
+
+        matched: Dict[Element, Tuple[List[Style], List[Style], List[Style]]] = dict()
+        for ele in root.iter(ElementTag):
+            hits = [hit for hit in self.candidates(ele) if hit[3].match(ele, root)]
+            hits.extend(hit for hit in fallback if ele in hit[3])
+            if not hits:
+                continue
+            hits.sort(key=lambda hit: hit[0])
+            layers = ([], [], [])
+            used = set()
+            for _, number, layer, _, rule in hits:
+                # 同一规则的多个选择器命中同一层时只叠加一次
+                if (number, layer) not in used:
+                    used.add((number, layer))
+                    layers[layer].append(rule)
+            matched[ele] = layers
+        return matched
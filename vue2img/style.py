@@ -1,71 +1,92 @@
-import re
-from copy import deepcopy
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Type
 
 from .attribute import *
+from .css import Declaration, parse_declarations
 
-stylePattern = re.compile(r"[^:|\n|;]+:[^;]+")
 
+def slots(cls):
+    """
+    为 dataclass 生成带 `__slots__` 的同名类 相当于 Python 3.10 的 `dataclass(slots=True)`
 
+    子类已经在父类里声明过的字段不会重复声明 字段默认值保存在 `__init__` 中 可以直接从类属性中删掉
+    """
+
+    inherited = set()
+    for base in cls.__mro__[1:]:
+        inherited.update(getattr(base, "__slots__", ()))
+    names = [f.name for f in fields(cls)]
+    namespace = dict(cls.__dict__)
+    namespace["__slots__"] = tuple(name for name in names if name not in inherited)
+    for name in names:
+        namespace.pop(name, None)
+    namespace.pop("__dict__", None)
+    namespace.pop("__weakref__", None)
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+def prototype(cls: Type[Attribute]):
+    """
+    默认属性工厂 所有样式共享同一个默认属性
+
+    属性只通过 `resolve()` 写时复制地计算 共享是安全的
+    """
+
+    attr = cls()
+    return lambda: attr
+
+
+@slots
 @dataclass
 class Style:
     "样式表"
     
-    fontSize: FontSize = field(default_factory=FontSize)
-    margin: Margin = field(default_factory=Margin)
-    padding: Padding = field(default_factory=Padding)
-    width: Width = field(default_factory=Width)
+    fontSize: FontSize = field(default_factory=prototype(FontSize))
+    margin: Margin = field(default_factory=prototype(Margin))
+    padding: Padding = field(default_factory=prototype(Padding))
+    width: Width = field(default_factory=prototype(Width))
     
-    top: Top = field(default_factory=Top)
-    left: Left = field(default_factory=Left)    
-    height: Height = field(default_factory=Height)
-    borderRadius: BorderRadius = field(default_factory=BorderRadius)
+    top: Top = field(default_factory=prototype(Top))
+    left: Left = field(default_factory=prototype(Left))    
+    height: Height = field(default_factory=prototype(Height))
+    borderRadius: BorderRadius = field(default_factory=prototype(BorderRadius))
     
-    gridGap: GridGap = field(default_factory=GridGap)
-    gridTemplateColumns: GridTemplateColumns = field(default_factory=GridTemplateColumns)
+    gridGap: GridGap = field(default_factory=prototype(GridGap))
+    gridTemplateColumns: GridTemplateColumns = field(default_factory=prototype(GridTemplateColumns))
     
-    color: Color = field(default_factory=Color)
-    float: Float = field(default_factory=Float)
-    display: Display = field(default_factory=Display)
-    position: Position = field(default_factory=Position)
-    fontFamily: FontFamily = field(default_factory=FontFamily)
-    backgroundColor: BackgroundColor = field(default_factory=BackgroundColor)
+    color: Color = field(default_factory=prototype(Color))
+    float: Float = field(default_factory=prototype(Float))
+    display: Display = field(default_factory=prototype(Display))
+    position: Position = field(default_factory=prototype(Position))
+    overflow: Overflow = field(default_factory=prototype(Overflow))
+    fontFamily: FontFamily = field(default_factory=prototype(FontFamily))
+    backgroundColor: BackgroundColor = field(default_factory=prototype(BackgroundColor))
 
     @property
     def attributs(self):
         "所有属性"
 
-        for name, attr in self.__dict__.items():
-            attr: Attribute
-            yield name, attr
+        for name in styleFields:
+            yield name, getattr(self, name)
 
     @property
     def inheritable(self):
         "可继承属性"
 
-        for name, attr in self.attributs:
-            if attr.value is not None:
-                continue
-            if not attr.inherited or attr.original != "inherit":
-                continue
-            yield name, attr
+        for name in inheritedFields:
+            attr = getattr(self, name)
+            if attr.value is None and attr.original == "inherit":
+                yield name, attr
 
     @property
     def prewidth(self):
-        "先找 width 相关属性"
-
-        # 这个函数有点想废掉 因为我发现 attributs 返回的顺序就是定义的顺序
-        # 也就是说可以修改变量的位置达到这个效果
-        # 但是可能就不美观了
-        pre = ["fontSize", "margin", "padding", "width"]
-        for name in pre:
-            if self[name].value is not None:
-                continue
-            yield name, self[name]
-        for name, attr in self.attributs:
-            if name in pre or attr.value is not None:
-                continue
-            yield name, attr
+        "按依赖顺序返回待计算的属性"
+
+        for name, _ in resolutionPlan:
+            attr = getattr(self, name)
+            if attr.value is None:
+                yield name, attr
 
     @property
     def original(self):
@@ -88,10 +109,20 @@ class Style:
         return f"Style({s})"
 
     def __getitem__(self, key: str) -> Attribute:
-        return self.__dict__.get(key, None)
+        if key in styleFields:
+            return getattr(self, key)
+        return None
 
     def __setitem__(self, key: str, value: Attribute):
-        self.__dict__[key] = value
+        setattr(self, key, value)
+
+    def __copy__(self):
+        "浅复制 只复制属性引用"
+
+        style = object.__new__(self.__class__)
+        for name in styleFields:
+            setattr(style, name, getattr(self, name))
+        return style
 
     def get(self, key: str, value: str = ""):
         "获取属性"
@@ -111,7 +142,7 @@ class Style:
                 elif key == "side":
                     vals.append(self.margin.side + self.padding.side)
                 elif key == "width":
-                    if self.display.equal("grid") and normal_index != -1:
+                    if self.display.equal("grid") and normal_index != -1 and self.gridTemplateColumns.gridTotal:
                         vals.append(self.gridTemplateColumns.next(normal_index))
                     else:
                         vals.append(self.width.value)
@@ -122,25 +153,35 @@ class Style:
         return tuple(vals)
 
     def inherit(self, parent_style: "Style", normal_index: int):
-        "继承父属性"
+        """
+        继承父属性
+
+        属性对象都是共享的 这里只替换引用 不会修改它们
+        """
 
-        for name, attr in self.inheritable:
-            attr.inherit(parent_style[name].value)  # 只继承值
+        for name in inheritedFields:
+            attr = getattr(self, name)
+            if attr.value is None and attr.original == "inherit":
+                setattr(self, name, getattr(parent_style, name))  # 直接共享父节点的计算结果
 
         if self.position.equal("absolute"):
             normal_index = -1
 
-        for name, attr in self.prewidth:
-            args = self.values(normal_index=-1, *attr.compared)
-            args = parent_style.values(normal_index=normal_index, *args)
-            attr.transform(*args)
+        # 按预先编译的计划取参数 依赖的属性一定已经算好了
+        for name, plan in resolutionPlan:
+            attr = getattr(self, name)
+            if attr.value is not None:
+                continue
+            setattr(self, name, attr.resolve(*[get(self, parent_style, normal_index) for get in plan]))
 
         return self
 
-    def update(self, *latests: "Style"):
-        "叠加属性值"
+    def update(self, *latests: Optional["Style"]):
+        "叠加属性值 跳过为 None 的样式"
 
         for latest in latests:
+            if latest is None:
+                continue
             for name, attr in latest.attributs:
                 if attr.unset:
                     continue
@@ -149,33 +190,126 @@ class Style:
                 self[name] = attr
         return self
     
+    @classmethod
+    def from_declarations(cls, declarations: Iterable[Declaration]):
+        "由解析好的声明生成 `Style` 类型"
+
+        style = cls()
+        for declaration in declarations:
+            attr = makeAttribute(declaration.name, declaration.value)
+            if attr is not None:
+                style[attr.name] = attr
+        return style
+
     @classmethod
     def parse_style(cls, s: str):
         "解析字符串 style 为 `Style` 类型"
         
-        style = cls()
-        if s is not None:
-            for cmd in stylePattern.findall(s.strip()):
-                attr = makeAttribute(cmd)
-                if attr is not None:
-                    style[attr.name] = attr
-        return style
+        if s is None:
+            return cls()
+        return cls.from_declarations(parse_declarations(s))
+
+
+# 所有属性名 按定义顺序排列
+styleFields: Dict[str, int] = {f.name: i for i, f in enumerate(fields(Style))}
+
+# 可继承的属性名
+inheritedFields: Tuple[str, ...] = tuple(f.name for f in fields(Style) if f.type.inherited)
+
+
+Accessor = Callable[[Style, Style, int], Any]
+
+
+def parent_width(style: Style, parent_style: Style, normal_index: int):
+    "父节点宽度 父节点是 grid 时为所在列的宽度"
+
+    if normal_index != -1 and parent_style.display.equal("grid") and parent_style.gridTemplateColumns.gridTotal:
+        return parent_style.gridTemplateColumns.next(normal_index)
+    return parent_style.width.value
+
+
+def compile_accessor(key: str) -> Optional[Accessor]:
+    """
+    把 `compared` 中的一项编译为取值函数 参数为 (自身样式, 父样式, 序号)
+
+    `parent.` 开头的取父节点的值 `side` 是左右 margin padding 之和 不认识的键返回 None
+    """
+
+    if not isinstance(key, str):
+        return lambda style, parent_style, normal_index: key
+    if key == "parent.width":
+        return parent_width
+    if key.startswith("parent."):
+        key = key[len("parent."):]
+        if key == "side":
+            return lambda style, parent_style, normal_index: parent_style.margin.side + parent_style.padding.side
+        if key in styleFields:
+            get = attrgetter(key)
+            return lambda style, parent_style, normal_index: get(parent_style).value
+        return None
+    if key == "side":
+        return lambda style, parent_style, normal_index: style.margin.side + style.padding.side
+    if key in styleFields:
+        get = attrgetter(key)
+        return lambda style, parent_style, normal_index: get(style).value
+    return None
+
+
+def compile_plan(compared: Tuple[str, ...]) -> Tuple[Accessor, ...]:
+    "把属性类的 `compared` 编译为取值函数列表"
+
+    return tuple(get for get in map(compile_accessor, compared) if get is not None)
+
+
+def dependencies(compared: Tuple[str, ...]) -> Set[str]:
+    "属性计算前需要先算好的自身属性"
+
+    deps = set()
+    for key in compared:
+        if key == "side":
+            deps.update(("margin", "padding"))
+        elif isinstance(key, str) and key in styleFields:
+            deps.add(key)
+    return deps
+
+
+def resolution_order(types: Dict[str, Type[Attribute]]) -> Tuple[Tuple[str, Tuple[Accessor, ...]], ...]:
+    "按依赖关系拓扑排序 没有依赖关系的属性保持定义顺序"
+
+    deps = {name: dependencies(cls.compared) - {name} for name, cls in types.items()}
+    order: List[str] = list()
+    while len(order) < len(deps):
+        for name in deps:
+            if name not in order and deps[name].issubset(order):
+                order.append(name)
+                break
+        else:
+            raise ValueError(f"样式属性存在循环依赖: {set(deps) - set(order)}")
+    return tuple((name, compile_plan(types[name].compared)) for name in order)
+
+
+# 属性计算计划 (属性名, 取值函数) 按依赖顺序排列
+resolutionPlan = resolution_order({f.name: f.type for f in fields(Style)})
 
 
+@slots
 @dataclass
 class SpanStyle(Style):
     display: Display = Display("inline")
 
 
+@slots
 @dataclass
 class TextStyle(SpanStyle): ...
 
 
+@slots
 @dataclass
 class PStyle(Style):
     margin: Margin = Margin("1em 0px")
 
 
+@slots
 @dataclass
 class H1Style(Style):
     fontSize: FontSize = FontSize("2em")
@@ -1,16 +1,49 @@
-import re
 from inspect import iscoroutinefunction as isAsync
 from io import TextIOWrapper
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
-from lxml.etree import HTML
 from lxml.etree import _Element as Element
 
+from .compiler import Compiled, VNode, VText, compile, varsPattern
 from .dom import DOM, BodyDOM, ImgDOM, Rectangle, TextDOM, makeDOM
-from .style import Style
-from .util import Travel, bfs, dfs, sync
+from .flat import FlatTree
+from .util import LRUCache, Travel, dfs, iter_preorder, sync
 
-varsPattern = re.compile(r"{{(.*?)}}")
+
+def children(node: Union[VNode, VText]) -> Tuple[Union[VNode, VText], ...]:
+    "编译节点的子节点"
+
+    return node.children if isinstance(node, VNode) else tuple()
+
+
+def depth(dom: DOM) -> int:
+    "节点深度"
+
+    depth = 0
+    while dom.parentNode is not None:
+        dom = dom.parentNode
+        depth += 1
+    return depth
+
+
+def offset(dom: DOM) -> Tuple[Optional[float], Optional[float]]:
+    "节点相对父节点的偏移 absolute 节点和还没放置的节点没有偏移"
+
+    return getattr(dom.content, "offsetX", None), getattr(dom.content, "offsetY", None)
+
+
+def place(dom: DOM, parent: DOM):
+    "把排版好的节点放进父节点 网格容器的子节点在父节点后序中统一放置"
+
+    if parent.style.display.equal("grid"):
+        return
+    if dom.style.display.equal("inline", "inline-block"):
+        if dom.tagName != "text":
+            w = 0
+            for child in dom.childNodes:
+                w += child.content.width
+            dom.content.width = w
+    parent.content.append(dom.content)
 
 
 class Template:
@@ -19,17 +52,21 @@ class Template:
     width: str = "1000px"
     font_size: str = "16px"
 
-    def __init__(self, vue: str = None, fp: TextIOWrapper = None, path: str = None, *args, **kwargs):
+    # 编译结果缓存 同一模板字符串只会解析一次
+    compile_cache: LRUCache = LRUCache(64)
+
+    def __init__(self, vue: str = None, fp: TextIOWrapper = None, path: str = None, *args, compiled: Compiled = None, **kwargs):
         "自动加载 `data()` 数据"
 
         if isAsync(self.data):
             self.__data = sync(self.data(*args, **kwargs))
         else:
             self.__data = self.data(*args, **kwargs)
-        self.__key = self.get("key", "dom")
-        self.__doms: Dict[str, DOM] = dict()
+        self.__doms: Dict[VNode, DOM] = dict()
 
-        if vue is not None:
+        if compiled is not None:
+            self.render(compiled)
+        elif vue is not None:
             self.loads(vue)
         elif fp is not None:
             self.load(fp)
@@ -47,40 +84,37 @@ class Template:
 
         return self.__data.get(key, value)
 
-    def dom(self, ele: Optional[Element]) -> Union[None, DOM, BodyDOM]:
+    @classmethod
+    def compile(cls, vue: str) -> Compiled:
+        "编译模板字符串 结果会被缓存"
+
+        return cls.compile_cache.fetch((vue, cls.width, cls.font_size), lambda: compile(vue, cls.width, cls.font_size))
+
+    def dom(self, node: Union[None, Element, VNode]) -> Union[None, DOM, BodyDOM]:
         "获取对应节点 不存在会新建"
 
-        if ele is None:
+        if node is None:
             return None
+        if isinstance(node, Element):
+            node = self.__compiled.elements.get(node)
+            if node is None:
+                return None
+
+        dom = self.__doms.get(node)
+        if dom is None:
+            dom = makeDOM(node.tag, inner_style=node.inner_style)
+
+            # 绑定属性
+            for k, v, bound in node.attributes:
+                dom.attributes[k] = self.get(v) if bound else v
+
+            # 选择器样式
+            dom.match((node.tag_rules, node.class_rules, node.id_rules))
 
-        did = ele.get(self.__key)
-        if did is None:
-            # 解析样式
-            plain: str = ele.get("style")
-            style = Style.parse_style(plain)
-            dom = makeDOM(ele.tag, inner_style=style)
-
-            # 解析属性
-            for k, v in ele.items():
-                k: str
-                v: str
-                if k != "style":
-                    if k[0] == ":":
-                        dom.attributes[k[1:]] = self.get(v)
-                    elif k in ["v-if", "v-else-if"]:
-                        dom.attributes[k] = self.get(v)
-                    elif k == "v-for":
-                        # 你猜我什么时候支持这个命令
-                        ...
-                    else:
-                        dom.attributes[k] = v
-            
             # 保存节点
-            did = str(id(dom))
-            ele.set(self.__key, did)
-            self.__doms[did] = dom
+            self.__doms[node] = dom
 
-        return self.__doms.get(did)        
+        return dom
 
     def cssselect(self, expr: str, limit: int = -1):
         """
@@ -111,20 +145,53 @@ class Template:
     def loads(self, vue: str) -> DOM:
         "直接读取模板字符串"
 
-        # 获取 template script style
-        html: Element = HTML(vue)
-        self.template: Element = html.find("body/template")
-        self.script: str = html.findtext("body/script")
-        self.style: str = re.sub(r"/\*.*?\*/", "", html.findtext("body/style"))
+        return self.render(self.compile(vue))
+
+    def render(self, compiled: Compiled, dry_run: bool = False, image_sizes: Optional[Dict[str, Tuple[int, int]]] = None) -> DOM:
+        """
+        使用当前 `data()` 渲染编译好的模板 只进行绑定、布局
+
+        dry_run: 只排版 图片尽量不下载 详见 `ImgDOM.measure_image()`
+
+        image_sizes: 图片地址到原始尺寸的提示
+        """
+
+        self.__compiled = compiled
+        self.__doms.clear()
+        self.__texts: Dict[VText, TextDOM] = dict()
+        self.__flat = None
+        self.__dry_run = dry_run
+        self.__image_sizes = image_sizes
+        self.template: Element = compiled.template
+        self.script: str = compiled.script
+        self.style: str = compiled.style
+
+        # 记录每个 `data()` 键被哪些插值、绑定属性和条件语句使用 供 `update()` 查找
+        self.__parents: Dict[Union[VNode, VText], Optional[VNode]] = dict()
+        self.__dependencies: Dict[str, List[Union[VNode, VText]]] = dict()
+        for node, _, parent in iter_preorder(compiled.root, children):
+            self.__parents[node] = parent
+            for key in node.keys:
+                self.__dependencies.setdefault(key, []).append(node)
 
         # 新建 dom 树根节点
-        self.template.set("style", f"width: {self.width};font-size: {self.font_size};")
-        self.root: BodyDOM = self.dom(self.template)
+        self.root: BodyDOM = self.dom(compiled.root)
+        self.__build(compiled.root)
+        self.__layout(self.root)
 
-        @bfs(self.template, lambda node: list(node.xpath("./*|text()")))
-        class _(Travel):
-            "利用 `etree._Element` 构建 `DOM` 树"
+        # 排版完成后自顶向下保存绝对坐标 每个节点只需要累加一次父节点坐标
+        for dom, _, _ in iter_preorder(self.root):
+            dom.content.locate()
+
+        return self.root
+
+    def __build(self, root: VNode):
+        "利用 `VNode` 构建 `DOM` 子树 root 对应的节点需要已经存在"
+
+        texts = self.__texts
 
+        @dfs(root, children)
+        class _(Travel):
             # 当出现判断语句 v-if v-else-if 时
             # 把该等待节点存进 parentNode.pending_nodes 列表
             # 等待以下情况出现时再对这个列表进行操作
@@ -133,14 +200,14 @@ class Template:
             # 3. 出现上述情况前父节点闭合了 通过 postorder() 解决
 
             @staticmethod
-            def preorder(ele: Union[Element, str], depth: int, parent: Element):
+            def preorder(node: Union[VNode, VText], depth: int, parent: VNode):
                 "建树"
 
                 if parent is None:
                     return
                 parentNode = self.dom(parent)
-                if isinstance(ele, Element):
-                    dom = self.dom(ele)
+                if isinstance(node, VNode):
+                    dom = self.dom(node)
                     if dom.contain("v-if", "v-else-if") is not None:
                         parentNode.pending(dom)
                     elif dom.contain("v-else") is not None:
@@ -148,37 +215,25 @@ class Template:
                     else:
                         parentNode.append(dom) # 一般节点
                 else:
-                    text = self.replace(ele)
+                    text = self.replace(node.text) if node.keys else node.text
                     if text != "":
                         parentNode.append(text) # 文字节点
-                    return False  # 这里为何返回 False 见 util.bfs 定义
+                        texts[node] = parentNode.childNodes[-1]
+                    return False
 
             @staticmethod
-            def postorder(ele: Union[Element, str], depth: int, parent: Element):
+            def postorder(node: VNode, depth: int, parent: VNode):
                 "处理闭合节点"
 
-                if ele is None:
-                    return
-                self.dom(ele).insert_true_node()
+                self.dom(node).insert_true_node()
 
-        # 解析 style
-        for item in self.style.split("}"):
-            item_split = item.split("{")
-            if len(item_split) != 2 or item_split[1].strip() == "":
-                continue
+    def __layout(self, root: DOM):
+        "排版 root 的子树 root 自身的偏移由它的父节点决定"
 
-            # 分析选择器类型
-            query = item_split[0].strip().split(" ")[-1]
-            style = Style.parse_style(item_split[1])
-            for dom in self.cssselect(item_split[0].strip()):
-                if query.startswith("#"):
-                    dom.id_style.update(style)
-                elif query.startswith("."):
-                    dom.class_style.update(style)
-                else:
-                    dom.tag_style.update(style)
+        dry_run = self.__dry_run
+        image_sizes = self.__image_sizes
 
-        @dfs(self.root)
+        @dfs(root)
         class _(Travel):
             "合并 `Style` 树、生成元素位置矩形"
 
@@ -189,7 +244,10 @@ class Template:
                 if isinstance(dom, TextDOM):
                     dom.set_size()
                 elif isinstance(dom, ImgDOM):
-                    dom.fetch_image()
+                    if dry_run:
+                        dom.measure_image(image_sizes)
+                    else:
+                        dom.fetch_image()
                 else:
                     Rectangle.init(dom)
 
@@ -201,20 +259,198 @@ class Template:
             def postorder(dom: DOM, depth: int, parent: DOM) -> Optional[bool]:
                 "设置矩形偏移 为子节点编号"
 
+                # 子节点都已排版 网格容器一次放好所有子节点
+                if dom.style.display.equal("grid"):
+                    dom.content.grid()
+
                 if parent is not None:
+                    place(dom, parent)
+
+    def __attached(self, dom: DOM) -> bool:
+        "节点是否在当前 `DOM` 树中"
+
+        while dom.parentNode is not None:
+            dom = dom.parentNode
+        return dom is self.root
+
+    def __discard(self, node: VNode, itself: bool = False) -> Set[Union[VNode, VText]]:
+        "丢掉子孙缓存的 `DOM` 下次构建时重新生成 返回被丢掉的节点"
+
+        replaced = set()
+        for child, _, _ in iter_preorder(node, children):
+            if itself or child is not node:
+                replaced.add(child)
+                self.__doms.pop(child, None)
+                self.__texts.pop(child, None)
+        return replaced
+
+    def __rebuild(self, node: VNode) -> Set[Union[VNode, VText]]:
+        "用当前 `data()` 重建节点的子树并排版 返回被替换掉的子孙"
+
+        dom = self.dom(node)
+        for child in dom.childNodes:
+            child.parentNode = None
+        dom.childNodes.clear()
+        dom.pending_nodes.clear()
+        dom.normal_total = 0
+
+        replaced = self.__discard(node)
+        self.__build(node)
+        self.__layout(dom)
+        return replaced
+
+    def update(self, **changes) -> DOM:
+        """
+        ### 局部更新
 
-                    if not parent.style.display.equal("grid"):
-                        if dom.style.display.equal("inline", "inline-block"):
-                            if dom.tagName != "text":
-                                w = 0
-                                for child in dom.childNodes:
-                                    w += child.content.width
-                                dom.content.width = w
+        修改 `data()` 中的值 只重新绑定依赖这些键的节点
 
-                    parent.content.append(dom.content)
+        尺寸变化的节点与其祖先会被标记 只有它们重新排列子节点 其余节点保留原来的排版结果
+        """
 
+        keys = list()
+        for key, value in changes.items():
+            exists = key in self.__data
+            old = self.__data.get(key)
+            self.__data[key] = value
+            if exists and (old is value or (isinstance(value, (str, int, float)) and old == value)):
+                continue
+            keys.append(key)
+
+        # 条件语句变化 或者文字在空与非空之间变化时 父节点的子节点列表会变 需要重建
+        rebuilds: Set[VNode] = set()
+        texts: Set[VText] = set()
+        bindings: Set[VNode] = set()
+        for key in keys:
+            for node in self.__dependencies.get(key, []):
+                if isinstance(node, VText):
+                    exists = node in self.__texts
+                    empty = self.replace(node.text) == ""
+                    if exists and not empty:
+                        texts.add(node)
+                    elif exists or not empty:
+                        rebuilds.add(self.__parents[node])
+                else:
+                    for k, v, bound in node.attributes:
+                        if bound and v == key and k in ("v-if", "v-else-if"):
+                            rebuilds.add(self.__parents[node])
+                    bindings.add(node)
+
+        # 脏节点 自身的矩形需要重新生成
+        dirty: List[DOM] = list()
+        replaced: Set[Union[VNode, VText]] = set()
+        for node in sorted(rebuilds, key=self.__depth):
+            if node in replaced:
+                continue
+            dom = self.__doms.get(node)
+            if dom is None or not self.__attached(dom):
+                # 不在树中的分支没法排版 丢掉整棵子树 等它出现时由祖先重建
+                replaced.update(self.__discard(node, itself=True))
+                continue
+            replaced.update(self.__rebuild(node))
+            dirty.append(dom)
+
+        for node in bindings:
+            if node in replaced:
+                continue
+            dom = self.dom(node)
+            for k, v, bound in node.attributes:
+                if bound and v in keys:
+                    dom.attributes[k] = self.get(v)
+            if isinstance(dom, ImgDOM) and self.__attached(dom):
+                self.__layout(dom)
+                dirty.append(dom)
+
+        for node in texts:
+            if node in replaced:
+                continue
+            dom = self.__texts[node]
+            dom.text = self.replace(node.text)
+            if self.__attached(dom):
+                dom.set_size()
+                dirty.append(dom)
+
+        self.__reflow(dirty)
+        self.__flat = None
         return self.root
 
+    def __depth(self, node: Union[VNode, VText]) -> int:
+        depth = 0
+        while self.__parents[node] is not None:
+            node = self.__parents[node]
+            depth += 1
+        return depth
+
+    def __reflow(self, dirty: List[DOM]):
+        "自底向上让脏节点的祖先重新排列子节点 然后更新位置变化的子树坐标"
+
+        depths: Dict[DOM, int] = dict()
+        for dom in dirty:
+            chain = list()
+            while dom.parentNode is not None and dom.parentNode not in depths:
+                dom = dom.parentNode
+                chain.append(dom)
+            base = depths[dom.parentNode] + 1 if dom.parentNode is not None else 0
+            for i, ancestor in enumerate(reversed(chain)):
+                depths[ancestor] = base + i
+
+        moved: List[DOM] = list(dirty)
+        for dom in sorted(depths, key=depths.get, reverse=True):
+            content = dom.content
+            offsets = [offset(child) for child in dom.childNodes]
+            content.height = 0.0
+            content.lastMargin = 0.0
+            for child in dom.childNodes:
+                place(child, dom)
+            if dom.style.display.equal("grid"):
+                content.grid()
+            for child, old in zip(dom.childNodes, offsets):
+                if offset(child) != old:
+                    moved.append(child)
+
+        # 自顶向下更新坐标 每棵子树只更新一次
+        located: Set[DOM] = set()
+        for top in sorted(moved, key=depth):
+            if top in located:
+                continue
+            for dom, _, _ in iter_preorder(top):
+                located.add(dom)
+                dom.content.relocate()
+
+    @classmethod
+    def dry_run(cls, vue: str = None, *args, compiled: Compiled = None, image_sizes: Optional[Dict[str, Tuple[int, int]]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        ### 只排版不绘制
+
+        返回可以直接 `json.dumps()` 的盒子树 根节点的高度就是画布高度
+
+        image_sizes: 图片地址到原始尺寸的提示 有提示的图片不会被下载
+
+        其余参数传给 `data()`
+        """
+
+        App = cls(None, None, None, *args, **kwargs)
+        App.render(compiled if compiled is not None else cls.compile(vue), dry_run=True, image_sizes=image_sizes)
+        return App.box_tree()
+
+    def box_tree(self) -> Dict[str, Any]:
+        "排版结果组成的盒子树 子节点在 `children` 中"
+
+        boxes: Dict[DOM, Dict[str, Any]] = dict()
+        for dom, _, parent in iter_preorder(self.root):
+            box = boxes[dom] = dom.box()
+            box["children"] = list()
+            if parent is not None:
+                boxes[parent]["children"].append(box)
+        return boxes[self.root]
+
+    def flatten(self) -> FlatTree:
+        "排版结果的扁平数组视图 重新渲染前会一直复用"
+
+        if self.__flat is None:
+            self.__flat = FlatTree(self.root)
+        return self.__flat
+
     def load(self, fp: TextIOWrapper):
         "从阅读器读取，阅读器须具有 fp.read()"
 
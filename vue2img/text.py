@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, List, Tuple
+
+from .util import LRUCache
+
+if TYPE_CHECKING:
+    from .manager import FontMetrics
+
+# 文字断行
+# 每行取宽度不超过限制的最长前缀 与逐字累加直到超出宽度的做法结果相同
+# 前缀宽度随长度单调不减 所以可以先倍增找到上界再二分 每行只需测量 O(log n) 次
+# 知道每个字符带来的宽度增量时 直接逐字累加 每个字符只算一次
+
+
+def fit(text: str, start: int, measure: Callable[[str], float], max_width: float) -> int:
+    "从 start 开始宽度不超过 max_width 的最长前缀长度"
+
+    remain = len(text) - start
+    lo, hi = 0, remain + 1  # text[start:start+lo] 放得下 text[start:start+hi] 放不下
+    k = 1
+    while k <= remain:
+        if measure(text[start:start + k]) > max_width:
+            hi = k
+            break
+        lo = k
+        k *= 2
+    else:
+        if lo < remain:
+            if measure(text[start:]) <= max_width:
+                return remain
+            hi = remain
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if measure(text[start:start + mid]) > max_width:
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+
+def break_lines(text: str, measure: Callable[[str], float], max_width: float) -> List[Tuple[int, int]]:
+    """
+    ### 断行
+
+    measure: 测量宽度的函数 例如 `font.getlength`
+
+    返回每行在原文中的 (起点, 终点)
+    """
+
+    lines: List[Tuple[int, int]] = list()
+    start = 0
+    while start < len(text):
+        # 单个字符就超出宽度时也要放下 否则会一直停在原地
+        end = start + max(1, fit(text, start, measure, max_width))
+        lines.append((start, end))
+        start = end
+    return lines
+
+
+def break_lines_by_step(text: str, step: Callable[[str, str], float], max_width: float) -> List[Tuple[int, int]]:
+    """
+    ### 按宽度增量断行
+
+    step: `step(prev, chn)` 返回在 prev 后追加 chn 增加的宽度 行首时 prev 为空
+
+    与逐字测量直到超出宽度的结果相同 返回每行在原文中的 (起点, 终点)
+    """
+
+    lines: List[Tuple[int, int]] = list()
+    start = 0
+    width = 0.0
+    prev = ""
+    for i, chn in enumerate(text):
+        w = width + step(prev, chn)
+        if w > max_width and i > start:
+            lines.append((start, i))
+            start = i
+            w = step("", chn)
+        if w > max_width:
+            # 单个字符就超出宽度 独占一行
+            lines.append((i, i + 1))
+            start = i + 1
+            width = 0.0
+            prev = ""
+            continue
+        width = w
+        prev = chn
+    if start < len(text):
+        lines.append((start, len(text)))
+    return lines
+
+
+@dataclass(frozen=True)
+class TextLayout:
+    """
+    文字排版结果
+
+    lines: 每行在原文中的 (起点, 终点)
+
+    heights: 每行高度
+
+    width, height: 最终尺寸 多行时宽度为最大宽度
+    """
+
+    lines: Tuple[Tuple[int, int], ...]
+    heights: Tuple[float, ...]
+    width: float
+    height: float
+
+
+# 进程内共享的排版结果缓存 以 (字体, 文字, 最大宽度) 为键
+# 调用 `textLayoutCache.info()` 查看命中率 `textLayoutCache.resize()` 调整上限
+textLayoutCache: LRUCache = LRUCache(4096)
+
+
+def layout_text(metrics: "FontMetrics", text: str, max_width: float) -> TextLayout:
+    "断行并计算尺寸 每行宽度都不超过 max_width 结果会被缓存"
+
+    def factory():
+        lines = tuple(metrics.break_lines(text, max_width))
+        heights = list()
+        for start, end in lines:
+            top, bottom = metrics.getextent(text[start:end])
+            heights.append(top / 2 + bottom)
+        if len(lines) == 1:
+            width = metrics.getlength(text)
+        else:
+            width = max_width
+        return TextLayout(lines, tuple(heights), width, sum(heights, 0.0))
+
+    return textLayoutCache.fetch((metrics.font, text, max_width), factory)
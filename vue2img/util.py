@@ -1,8 +1,10 @@
 import asyncio
+from collections import OrderedDict, deque
 from inspect import isfunction
-from typing import Callable, Coroutine, List, Optional, Set, TypeVar
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
-from .dom import DOM
+if TYPE_CHECKING:
+    from .dom import DOM
 
 T = TypeVar("T")
 
@@ -23,7 +25,7 @@ class Travel:
         return True
     
     @staticmethod
-    def getchildren(node: DOM) -> List[DOM]:
+    def getchildren(node: "DOM") -> List["DOM"]:
         "获取子元素列表"
 
         # 这里默认返回 dom 的子元素
@@ -42,6 +44,8 @@ def bfs(
     root: 起点 不为空时自动启动一次
     
     getchildren: 获取子节点函数
+
+    后序在节点的所有子节点都访问过后调用
     """
 
     def warpper(cls: Travel):
@@ -56,27 +60,18 @@ def bfs(
             travel.getchildren = getchildren
 
         def run(root: T):
-            depth = 0
-            parent = None
-            used: Set[T] = set()
-            nodes: List[Optional[T]] = [root, None]
+            # 队列中保存 (节点, 深度, 父节点, 是否已访问)
+            # 节点被访问后 在其子节点之后再入队一次 出队时说明子节点都已访问过 调用后序
+            nodes: Deque[Tuple[T, int, Optional[T], bool]] = deque([(root, 0, None, False)])
             while nodes:
-                node = nodes.pop(0)
-                if node is None:
-                    depth += 1
-                    if nodes:
-                        nodes.append(None)
-                elif node in used:
-                    travel.postorder(parent, depth-1, None)
-                    # 这里 None 是因为我想不到怎么获取前一个 parent 的 parent 了
-                    # 理论上是可以从 used 中找到的 但是我懒了
-                    parent = node
-                else:
-                    if travel.preorder(node, depth, parent) is not False:
-                        # 返回 False 说明当前 node 不是 T 类型 不再进行后续 bfs
-                        used.add(node)
-                        nodes.append(node)
-                        nodes.extend(travel.getchildren(node))
+                node, depth, parent, visited = nodes.popleft()
+                if visited:
+                    travel.postorder(node, depth, parent)
+                elif travel.preorder(node, depth, parent) is not False:
+                    # 返回 False 说明当前 node 不是 T 类型 不再进行后续 bfs
+                    nodes.extend((child, depth + 1, node, False) for child in [*travel.getchildren(node)])
+                    nodes.append((node, depth, parent, True))
+
         if root is not None:
             run(root)
         return run
@@ -107,20 +102,18 @@ def dfs(
             travel.getchildren = getchildren
 
         def run(root: T):
-            depth = 0
-            parents: List[T] = [None]
-            nodes: List[Optional[T]] = [root]
-            while nodes:
-                node = nodes.pop(0)
-                if node is None:
-                    depth -= 1
-                    node = parents.pop()
-                    travel.postorder(node, depth, parents[-1])
-                else:
-                    if travel.preorder(node, depth, parents[-1]) is not False:
-                        nodes = [*travel.getchildren(node), None, *nodes]
-                        depth += 1
-                        parents.append(node)
+            # 用显式栈代替递归 栈中保存 (节点, 尚未访问的子节点) 栈深就是当前深度
+            if travel.preorder(root, 0, None) is False:
+                return
+            stack: List[Tuple[T, Iterator[T]]] = [(root, iter([*travel.getchildren(root)]))]
+            while stack:
+                node, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    travel.postorder(node, len(stack), stack[-1][0] if stack else None)
+                elif travel.preorder(child, len(stack), node) is not False:
+                    stack.append((child, iter([*travel.getchildren(child)])))
 
         if root is not None:
             run(root)
@@ -128,6 +121,147 @@ def dfs(
     return warpper
 
 
+def iter_preorder(root: T, getchildren: Callable[[T], Iterable[T]] = Travel.getchildren) -> Iterator[Tuple[T, int, Optional[T]]]:
+    """
+    ### 前序遍历
+
+    与 `dfs` 顺序相同的生成器 依次返回 (节点, 深度, 父节点)
+    """
+
+    stack: List[Tuple[T, int, Optional[T]]] = [(root, 0, None)]
+    while stack:
+        node, depth, parent = stack.pop()
+        yield node, depth, parent
+        children = [*getchildren(node)]
+        stack.extend((child, depth + 1, node) for child in reversed(children))
+
+
+def iter_postorder(root: T, getchildren: Callable[[T], Iterable[T]] = Travel.getchildren) -> Iterator[Tuple[T, int, Optional[T]]]:
+    """
+    ### 后序遍历
+
+    与 `dfs` 的后序顺序相同的生成器 子节点先于父节点返回 (节点, 深度, 父节点)
+    """
+
+    stack: List[Tuple[T, Optional[T], Iterator[T]]] = [(root, None, iter([*getchildren(root)]))]
+    while stack:
+        node, parent, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            yield node, len(stack), parent
+        else:
+            stack.append((child, node, iter([*getchildren(child)])))
+
+
+class LRUCache:
+    """
+    ### 有界 LRU 缓存
+
+    maxsize: 最大缓存数 超出后淘汰最久未使用的项
+
+    weigh, maxweight: 计算每项权重的函数与总权重上限 例如位图的像素数 不传则只限制项数
+
+    hits, misses: 命中与未命中次数
+
+    evictions: 被淘汰的项数
+    """
+
+    def __init__(self, maxsize: int = 128, weigh: Optional[Callable[[Any], float]] = None, maxweight: float = None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.maxweight = maxweight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.__weights: Dict[Hashable, float] = dict()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key: Hashable):
+        return key in self.__data
+
+    def get(self, key: Hashable, default: Any = None):
+        "获取缓存 会计入命中统计"
+
+        if key in self.__data:
+            self.hits += 1
+            self.__data.move_to_end(key)
+            return self.__data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: T) -> T:
+        "写入缓存"
+
+        if self.weigh is not None:
+            weight = self.weigh(value)
+            if self.maxweight is not None and weight > self.maxweight:
+                # 单项就超出上限 不缓存 免得把其他项全部挤掉
+                return value
+            self.weight += weight - self.__weights.get(key, 0)
+            self.__weights[key] = weight
+        self.__data[key] = value
+        self.__data.move_to_end(key)
+        self.__evict()
+        return value
+
+    def __evict(self):
+        while len(self.__data) > self.maxsize or self.maxweight is not None and self.weight > self.maxweight and self.__data:
+            key, _ = self.__data.popitem(last=False)
+            self.weight -= self.__weights.pop(key, 0)
+            self.evictions += 1
+
+    def resize(self, maxsize: int, maxweight: float = None):
+        "调整上限 超出的项立即淘汰"
+
+        self.maxsize = maxsize
+        if maxweight is not None:
+            self.maxweight = maxweight
+        self.__evict()
+
+    def fetch(self, key: Hashable, factory: Callable[[], T]) -> T:
+        "获取缓存 不存在时调用 factory 生成并写入"
+
+        if key in self.__data:
+            self.hits += 1
+            self.__data.move_to_end(key)
+            return self.__data[key]
+        self.misses += 1
+        return self.set(key, factory())
+
+    def clear(self):
+        "清空缓存及统计"
+
+        self.__data.clear()
+        self.__weights.clear()
+        self.hits = self.misses = self.evictions = self.weight = 0
+
+    @property
+    def hit_rate(self) -> float:
+        "命中率"
+
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self) -> Dict[str, float]:
+        "统计信息"
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.__data),
+            "maxsize": self.maxsize,
+            "weight": self.weight,
+            "maxweight": self.maxweight,
+            "hit_rate": self.hit_rate,
+        }
+
+
 # 以下偷自 bilibili-api-python
 
 def __ensure_event_loop() -> None: